@@ -1,18 +1,42 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, g, Response, stream_with_context
 from flask_cors import CORS
 import json
 import re
 from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional, Tuple
+import threading
+import queue
 import logging
 from config import Config
-import openai
-import requests
+from logging_config import setup_logging, truncate
+from audit_log import AuditLogWriter
+from cache import TTLCache
+from scheduler import DailyScheduler, parse_times
+from subscriptions import CLOSED, PollerLimitReached, SubscriptionHub
+from snapshots import SnapshotStore, diff_snapshots
+from threat_store import ThreatStore
+import response_format
+from compression import apply_etag, compress_response, passthrough_headers
+from assets import load_manifest, send_asset
+from endpoints import EndpointRegistry
+from lazy_import import lazy_import
+from profiling import ProfileBuffer, RequestProfile
+from explainer import (build_delta_prompt, build_drilldown_prompt, build_explanation_prompt, create_client,
+                       explanation_cache_key, generate_explanation, stream_explanation)
+import hmac
 import os
+import random
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import (REGISTRY, CONTENT_TYPE_LATEST, HTTP_REQUEST_LATENCY, STAGE_LATENCY, UPSTREAM_LATENCY,
+                     UPSTREAM_RESPONSES, QUERIES_PROCESSED, SPECULATIVE_PREFETCHES, record_llm_usage)
+
+# Imported on first use, so startup does not wait for the HTTP client stack
+requests = lazy_import('requests')
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 def detect_language(text: str) -> str:
@@ -55,7 +79,8 @@ def detect_language(text: str) -> str:
     # These are characters that are distinctly different in Traditional vs Simplified Chinese
     traditional_specific_chars = len(re.findall(r'[繁體學習實務資訊網電腦資料庫員顯組織異執威脅偵測應報議評風險等級關鍵發現執麼異為麼們被認為潛擊解釋簡潔與於個會對來說過時這樣還從根據將讓夠進處設置測試連態應請數詢端點標題援幫說]', text))
     # Debug logging for language detection
-    logger.info(f"Language detection for '{text}': chinese_ratio={chinese_ratio:.3f}, traditional_specific_chars={traditional_specific_chars}")
+    logger.debug("Language detection for '%s': chinese_ratio=%.3f, traditional_specific_chars=%d",
+                 truncate(text), chinese_ratio, traditional_specific_chars)
     
     # Determine language based on highest ratio
     max_ratio = max(chinese_ratio, japanese_ratio, korean_ratio, arabic_ratio, cyrillic_ratio)
@@ -63,10 +88,11 @@ def detect_language(text: str) -> str:
     if max_ratio > 0.3:  # If any non-Latin script has significant presence
         # Check for Traditional Chinese first - if any traditional-specific characters are found, use Traditional Chinese
         if chinese_ratio > 0.3 and traditional_specific_chars > 0:
-            logger.info(f"Detected Traditional Chinese: chinese_ratio={chinese_ratio:.3f}, traditional_specific_chars={traditional_specific_chars}")
+            logger.debug("Detected Traditional Chinese: chinese_ratio=%.3f, traditional_specific_chars=%d",
+                         chinese_ratio, traditional_specific_chars)
             return 'zh-tw'
         elif chinese_ratio == max_ratio:
-            logger.info(f"Detected Simplified Chinese: chinese_ratio={chinese_ratio:.3f}")
+            logger.debug("Detected Simplified Chinese: chinese_ratio=%.3f", chinese_ratio)
             return 'zh'
         elif japanese_ratio == max_ratio:
             return 'ja'
@@ -83,49 +109,55 @@ def detect_language(text: str) -> str:
 app = Flask(__name__)
 CORS(app)
 
-# Load OpenAPI specification
-with open('openapi.json', 'r', encoding='utf-8') as f:
-    openapi_spec = json.load(f)
+# Endpoints of the OpenAPI specification, cached on disk by spec hash
+endpoint_registry = EndpointRegistry.load('openapi.json', Config.ENDPOINT_CACHE_DIR or None)
+
+# Aggregate questions answered from the local threat store, by operation
+AGGREGATE_PATTERNS = {
+    'count': re.compile(r'\bhow many\b|\bcount\b|\bnumber of\b'),
+    'top': re.compile(r'most (?:often|frequent(?:ly)?|common)|shows? up most|appears? most|most occurrences'),
+    'trend': re.compile(r'\btrends?\b|over time|per day|day by day'),
+}
 
 class NaturalLanguageProcessor:
     """Processes natural language queries and converts them to API requests"""
     
-    def __init__(self, openapi_spec: dict):
-        self.openapi_spec = openapi_spec
-        self.endpoints = self._parse_endpoints()
-        
-    def _parse_endpoints(self) -> Dict[str, dict]:
-        """Parse OpenAPI endpoints and their parameters"""
-        endpoints = {}
-        for path, methods in self.openapi_spec.get('paths', {}).items():
-            for method, details in methods.items():
-                endpoint_key = f"{method.upper()} {path}"
-                endpoints[endpoint_key] = {
-                    'path': path,
-                    'method': method.upper(),
-                    'summary': details.get('summary', ''),
-                    'description': details.get('description', ''),
-                    'parameters': details.get('parameters', []),
-                    'operationId': details.get('operationId', '')
-                }
-        return endpoints
+    def __init__(self, registry: EndpointRegistry, threat_store: Optional[ThreatStore] = None):
+        self.registry = registry
+        self.endpoints = registry.endpoints
+        self.threat_store = threat_store
     
     def process_query(self, query: str) -> Dict:
         """Process natural language query and return API request details"""
         query_lower = query.lower().strip()
-        detected_language = detect_language(query)
-        logger.info(f"Processing query: '{query}' (detected language: {detected_language})")
+        with STAGE_LATENCY.time(stage='detect_language'):
+            detected_language = detect_language(query)
+        logger.info("Processing query '%s' (detected language: %s)", truncate(query), detected_language,
+                    extra={'detected_language': detected_language})
+        
+        # Count, top-k and trend questions are answered from the local threat store when it fully covers the period
+        if self.threat_store is not None:
+            aggregate = self._extract_aggregate(query_lower)
+            if aggregate:
+                result = self._answer_aggregate(query, aggregate, detected_language)
+                if result:
+                    return result
+                logger.debug("Threat store does not cover %s; using the TDR API", aggregate)
         
         # First try rule-based approach
-        intent_result = self._extract_intent(query_lower)
+        with STAGE_LATENCY.time(stage='extract_intent'):
+            intent_result = self._extract_intent(query_lower)
         if intent_result:
             endpoint_key, extracted_params = intent_result
             endpoint_info = self.endpoints[endpoint_key]
-            logger.info(f"Rule-based match found: {endpoint_key} with params: {extracted_params}")
+            logger.info("Rule-based match found: %s with params: %s", endpoint_key, extracted_params,
+                        extra={'endpoint': endpoint_key, 'processing_method': 'rule_based'})
             
             # Build API request
-            api_request = self._build_api_request(endpoint_info, extracted_params)
+            with STAGE_LATENCY.time(stage='build_api_request'):
+                api_request = self._build_api_request(endpoint_info, extracted_params)
             
+            QUERIES_PROCESSED.inc(processing_method='rule_based')
             return {
                 'endpoint': endpoint_key,
                 'summary': endpoint_info['summary'],
@@ -137,25 +169,27 @@ class NaturalLanguageProcessor:
             }
         
         # If rule-based approach fails, try OpenAI
-        logger.info("Rule-based parsing failed, trying AI...")
-        ai_result = openai_parser.parse_query(query, detected_language)
+        logger.debug("Rule-based parsing failed, trying AI...")
+        with STAGE_LATENCY.time(stage='llm_parse'):
+            ai_result = openai_parser.parse_query(query, detected_language)
         
         if ai_result:
             endpoint_key = ai_result['endpoint']
             extracted_params = ai_result['parameters']
-            logger.info(f"OpenAI match found: {endpoint_key} with params: {extracted_params}")
-            
-            # Find endpoint info
-            endpoint_info = None
-            for key, info in self.endpoints.items():
-                if key == endpoint_key:
-                    endpoint_info = info
-                    break
+            logger.info("OpenAI match found: %s with params: %s", endpoint_key, extracted_params,
+                        extra={'endpoint': endpoint_key, 'processing_method': 'openai'})
             
-            if endpoint_info:
+            # Find endpoint info, also for keys with their path parameters filled in
+            resolved = self.registry.resolve(str(endpoint_key))
+            if resolved:
+                endpoint_key, path_params = resolved
+                endpoint_info = self.endpoints[endpoint_key]
+                extracted_params = {**path_params, **extracted_params}
                 # Build API request
-                api_request = self._build_api_request(endpoint_info, extracted_params)
+                with STAGE_LATENCY.time(stage='build_api_request'):
+                    api_request = self._build_api_request(endpoint_info, extracted_params)
                 
+                QUERIES_PROCESSED.inc(processing_method='openai')
                 return {
                     'endpoint': endpoint_key,
                     'summary': endpoint_info['summary'],
@@ -168,7 +202,9 @@ class NaturalLanguageProcessor:
                 }
         
         # If both methods fail
-        logger.warning(f"Both rule-based and OpenAI parsing failed for query: '{query}'")
+        logger.warning("Both rule-based and OpenAI parsing failed for query: '%s'", truncate(query),
+                       extra={'processing_method': 'failed'})
+        QUERIES_PROCESSED.inc(processing_method='failed')
         return {
             'error': 'Could not understand the query. Please try rephrasing your request.',
             'suggestions': self._get_suggestion_queries(),
@@ -230,6 +266,102 @@ class NaturalLanguageProcessor:
         
         return None
     
+    def _extract_aggregate(self, query: str) -> Optional[Dict]:
+        """Extract an aggregate question (operation, kind, date range) from the query"""
+        operation = next((name for name, pattern in AGGREGATE_PATTERNS.items() if pattern.search(query)), None)
+        if not operation:
+            return None
+        
+        if any(keyword in query for keyword in ['process', 'execution', 'executable']):
+            kind = 'rare_process'
+        elif 'device' in query:
+            kind = 'device'
+        elif 'user' in query:
+            kind = 'user'
+        elif any(keyword in query for keyword in ['organization', 'org', 'company', 'overall', 'risk score']):
+            kind = 'org'
+        else:
+            return None
+        if operation == 'top' and kind == 'org':
+            return None
+        
+        since, until = self._extract_period(query)
+        params = {'operation': operation, 'kind': kind, 'since': since, 'until': until}
+        if operation == 'top':
+            params['limit'] = self._extract_limit(query, default=10)
+            params['field'] = 'executable' if kind == 'rare_process' and 'executable' in query else 'entity'
+        return params
+    
+    def _extract_period(self, query: str) -> Tuple[Optional[str], Optional[str]]:
+        """Extract an inclusive (since, until) date range; (None, None) means all stored data"""
+        day = self._extract_date(query)
+        if day:
+            return day, day
+        today = date.today()
+        match = re.search(r'(?:last|past)\s*(\d+)\s*days?', query)
+        if match:
+            return (today - timedelta(days=int(match.group(1)))).isoformat(), today.isoformat()
+        if 'this month' in query:
+            return today.replace(day=1).isoformat(), today.isoformat()
+        if 'last month' in query:
+            last_day = today.replace(day=1) - timedelta(days=1)
+            return last_day.replace(day=1).isoformat(), last_day.isoformat()
+        if 'this week' in query:
+            return (today - timedelta(days=today.weekday())).isoformat(), today.isoformat()
+        if 'last week' in query:
+            monday = today - timedelta(days=today.weekday() + 7)
+            return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+        if 'this year' in query:
+            return today.replace(month=1, day=1).isoformat(), today.isoformat()
+        if 'today' in query:
+            return today.isoformat(), today.isoformat()
+        return None, None
+    
+    def _answer_aggregate(self, query: str, params: Dict, detected_language: str) -> Optional[Dict]:
+        """Answer an aggregate question from the local threat store, or None if it does not fully cover the period"""
+        with STAGE_LATENCY.time(stage='aggregate'):
+            answer = self.threat_store.aggregate(**params)
+        result = answer['result']
+        if not result or (isinstance(result, dict) and not result.get('days')):
+            return None
+        if not answer['coverage']['complete']:
+            # Only part of the period was seen in full: the question goes upstream instead
+            logger.info("Threat store covers %d of %d days for %s %s", answer['coverage']['days_covered'],
+                        answer['coverage']['days_requested'], params['operation'], params['kind'])
+            return None
+        logger.info("Aggregate match found: %s %s", params['operation'], params['kind'],
+                    extra={'processing_method': 'local_store'})
+        labels = {'user': 'risky users', 'device': 'risky devices', 'rare_process': 'rare process executions',
+                  'org': 'organization risk'}
+        period = f" ({params['since'] or 'start'} to {params['until'] or 'today'})" if params['since'] else ''
+        summary = {
+            'count': f"Count of {labels[params['kind']]}{period}",
+            'top': f"Most frequent {'executables' if params.get('field') == 'executable' else 'entities'} "
+                   f"in {labels[params['kind']]}{period}",
+            'trend': f"Daily trend of {labels[params['kind']]}{period}",
+        }[params['operation']]
+        
+        QUERIES_PROCESSED.inc(processing_method='local_store')
+        return {
+            'endpoint': 'LOCAL threat store',
+            'summary': summary,
+            # Served by /api/store/query rather than the TDR API
+            'api_request': {
+                'method': 'GET',
+                'url': '/api/store/query',
+                'query_params': params,
+                'path_params': {},
+                'headers': {},
+                'base_url': '',
+                'local': True
+            },
+            'answer': answer,
+            'natural_language_query': query,
+            'extracted_parameters': params,
+            'processing_method': 'local_store',
+            'detected_language': detected_language
+        }
+    
     def _extract_user_id(self, query: str) -> Optional[str]:
         """Extract user ID from query"""
         # Look for patterns like "user123", "user 123", "user id 123"
@@ -311,18 +443,18 @@ class NaturalLanguageProcessor:
     def _build_api_request(self, endpoint_info: dict, params: dict) -> dict:
         """Build API request structure"""
         path = endpoint_info['path']
-        logger.info(f"Building API request for endpoint: {path}")
+        logger.debug("Building API request for endpoint: %s", path)
         
         # Remove trailing slash if present
         if path.endswith('/'):
             path = path[:-1]
-            logger.info(f"Removed trailing slash, new path: {path}")
+            logger.debug("Removed trailing slash, new path: %s", path)
         
         # Replace path parameters
         for param_name, param_value in params.items():
             if f'{{{param_name}}}' in path:
                 path = path.replace(f'{{{param_name}}}', str(param_value))
-                logger.info(f"Replaced path parameter {param_name} with {param_value}")
+                logger.debug("Replaced path parameter %s with %s", param_name, param_value)
         
         # Separate query parameters
         query_params = {}
@@ -343,7 +475,8 @@ class NaturalLanguageProcessor:
             'base_url': Config.API_BASE_URL
         }
         
-        logger.info(f"Final API request: {api_request}")
+        # Headers are deliberately not logged: they carry the API token
+        logger.debug("Final API request: %s %s query_params=%s", api_request['method'], path, query_params)
         return api_request
     
     def _get_suggestion_queries(self) -> List[str]:
@@ -360,24 +493,8 @@ class NaturalLanguageProcessor:
 class OpenAIParser:
     """OpenAI-powered natural language query parser"""
     
-    def __init__(self, openapi_spec: dict):
-        self.openapi_spec = openapi_spec
-        self.endpoints = self._parse_endpoints()
-        
-    def _parse_endpoints(self) -> Dict[str, dict]:
-        """Parse OpenAPI endpoints for AI context"""
-        endpoints = {}
-        for path, methods in self.openapi_spec.get('paths', {}).items():
-            for method, details in methods.items():
-                endpoint_key = f"{method.upper()} {path}"
-                endpoints[endpoint_key] = {
-                    'path': path,
-                    'method': method.upper(),
-                    'summary': details.get('summary', ''),
-                    'description': details.get('description', ''),
-                    'parameters': details.get('parameters', [])
-                }
-        return endpoints
+    def __init__(self, registry: EndpointRegistry):
+        self.registry = registry
     
     def parse_query(self, query: str, detected_language: str = 'en') -> Optional[Dict]:
         """Use OpenAI to parse natural language query"""
@@ -386,21 +503,11 @@ class OpenAIParser:
             return None
             
         try:
-            logger.info(f"AI parsing query: '{query}' (language: {detected_language})")
-            logger.info(f"AI API Key configured: {bool(Config.OPENAI_API_KEY)}")
-            logger.info(f"AI Model: {Config.OPENAI_MODEL}")
-            logger.info(f"AI Base URL: {Config.OPENAI_BASE_URL}")
+            logger.debug("AI parsing query: '%s' (language: %s, model: %s, base URL: %s)",
+                         truncate(query), detected_language, Config.OPENAI_MODEL, Config.OPENAI_BASE_URL)
             
-            # Create context for the AI
-            endpoints_context = []
-            for endpoint_key, info in self.endpoints.items():
-                endpoints_context.append(f"- {endpoint_key}: {info['summary']}")
-                if info['description']:
-                    endpoints_context.append(f"  Description: {info['description']}")
-                if info['parameters']:
-                    params = [f"{p['name']} ({p.get('schema', {}).get('type', 'string')})" for p in info['parameters']]
-                    endpoints_context.append(f"  Parameters: {', '.join(params)}")
-                endpoints_context.append("")
+            # Endpoint list for the AI, rendered once by the registry
+            endpoints_context = self.registry.prompt_context
             
             # Generate language-specific prompt
             if detected_language == 'zh-tw':
@@ -408,7 +515,7 @@ class OpenAIParser:
 將自然語言查詢轉換為結構化的API請求。
 
 可用的API端點:
-{chr(10).join(endpoints_context)}
+{endpoints_context}
 
 查詢: "{query}"
 
@@ -438,7 +545,7 @@ class OpenAIParser:
 将自然语言查询转换为结构化的API请求。
 
 可用的API端点:
-{chr(10).join(endpoints_context)}
+{endpoints_context}
 
 查询: "{query}"
 
@@ -468,7 +575,7 @@ class OpenAIParser:
 Convert the natural language query into a structured API request.
 
 Available API endpoints:
-{chr(10).join(endpoints_context)}
+{endpoints_context}
 
 Query: "{query}"
 
@@ -502,52 +609,49 @@ Return only valid JSON, no additional text."""
             else:
                 system_prompt = "You are a helpful API query parser. Always return valid JSON."
             
-            # Prepare headers for OpenRouter (optional but recommended)
-            extra_headers = {
-                "HTTP-Referer": "https://github.com/yourusername/tdr-agent",  # Optional: Your app URL
-                "X-Title": "TDR Agent"  # Optional: Your app name
-            }
-            
             # Create OpenAI client with OpenRouter base URL and headers
-            client = openai.OpenAI(
-                api_key=Config.OPENAI_API_KEY,
-                base_url=Config.OPENAI_BASE_URL,
-                default_headers=extra_headers
-            )
+            client = create_client()
             
-            response = client.chat.completions.create(
-                model=Config.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            with UPSTREAM_LATENCY.time(upstream='llm', operation='parse'):
+                response = client.chat.completions.create(
+                    model=Config.OPENAI_MODEL,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}
+                    ]
+                )
+            record_llm_usage(response, Config.OPENAI_MODEL, 'parse')
+            UPSTREAM_RESPONSES.inc(upstream='llm', status=200)
             
             result_text = response.choices[0].message.content.strip()
-            logger.info(f"AI response: {result_text}")
+            logger.debug("AI response: %s", truncate(result_text))
             
             # Parse JSON response
             result = json.loads(result_text)
-            logger.info(f"Parsed AI result: {result}")
             
             # Validate the result
             if 'endpoint' not in result or 'parameters' not in result:
                 logger.error("Invalid AI response structure")
                 return None
                 
-            logger.info(f"AI parsing successful: {result['endpoint']} with params: {result['parameters']}")
+            logger.info("AI parsing successful: %s with params: %s", result['endpoint'], truncate(result['parameters']))
             return result
             
         except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse AI JSON response: {e}")
+            logger.error("Failed to parse AI JSON response: %s", e)
             return None
         except Exception as e:
-            logger.error(f"AI API error: {e}")
+            UPSTREAM_RESPONSES.inc(upstream='llm', status=getattr(e, 'status_code', None) or 'error')
+            logger.error("AI API error: %s", e)
             return None
 
 # Initialize the processors
-nlp = NaturalLanguageProcessor(openapi_spec)
-openai_parser = OpenAIParser(openapi_spec)
+# Local store of every /threats/* response, used for aggregate questions
+threat_store = (ThreatStore(Config.THREAT_STORE_PATH, Config.THREAT_STORE_RETENTION_DAYS)
+                if Config.THREAT_STORE_ENABLED else None)
+
+nlp = NaturalLanguageProcessor(endpoint_registry, threat_store=threat_store)
+openai_parser = OpenAIParser(endpoint_registry)
 
 # Configuration file path
 CONFIG_FILE = 'tdr_config.json'
@@ -557,10 +661,10 @@ def save_config_to_file(config_data):
     try:
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, indent=2)
-        logger.info(f"Configuration saved to {CONFIG_FILE}")
+        logger.info("Configuration saved to %s", CONFIG_FILE)
         return True
     except Exception as e:
-        logger.error(f"Failed to save configuration: {e}")
+        logger.error("Failed to save configuration: %s", e)
         return False
 
 def load_config_from_file():
@@ -569,13 +673,13 @@ def load_config_from_file():
         if os.path.exists(CONFIG_FILE):
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
                 config_data = json.load(f)
-            logger.info(f"Configuration loaded from {CONFIG_FILE}")
+            logger.info("Configuration loaded from %s", CONFIG_FILE)
             return config_data
         else:
-            logger.info(f"Configuration file {CONFIG_FILE} not found, using defaults")
+            logger.info("Configuration file %s not found, using defaults", CONFIG_FILE)
             return None
     except Exception as e:
-        logger.error(f"Failed to load configuration: {e}")
+        logger.error("Failed to load configuration: %s", e)
         return None
 
 # Load configuration on startup
@@ -595,11 +699,152 @@ if saved_config:
         openrouter_base_url
     )
 
+# Request audit log writer
+audit_log = AuditLogWriter(
+    Config.AUDIT_LOG_FILE,
+    max_queue=Config.AUDIT_LOG_QUEUE_SIZE,
+    batch_size=Config.AUDIT_LOG_BATCH_SIZE,
+    flush_interval=Config.AUDIT_LOG_FLUSH_INTERVAL,
+    max_bytes=Config.AUDIT_LOG_MAX_BYTES,
+    backup_count=Config.AUDIT_LOG_BACKUP_COUNT
+)
+
+# Endpoints whose requests are written to the audit log
+AUDITED_ENDPOINTS = {'process_natural_language_query', 'proxy_api_request', 'ai_explain_response', 'ask', 'drilldown'}
+
+def audit(**fields):
+    """Attach fields to the current request's audit log entry"""
+    g.setdefault('audit', {}).update(fields)
+
+# Endpoints that can be profiled on demand (a streamed response would end its profile before the body is produced)
+PROFILED_ENDPOINTS = {'process_natural_language_query', 'ai_explain_response', 'drilldown'}
+profile_buffer = ProfileBuffer(Config.PROFILE_BUFFER_SIZE)
+
+if Config.PROFILE_ENABLED and not Config.PROFILE_TOKEN:
+    logger.warning("TDR_PROFILE_TOKEN is not set: no requests are profiled and /api/profiles is disabled")
+
+def profile_token_ok(value: Optional[str]) -> bool:
+    """Whether a header value matches the configured profiling token (never, if none is configured)"""
+    if not Config.PROFILE_TOKEN:
+        return False
+    return hmac.compare_digest((value or '').encode('utf-8'), Config.PROFILE_TOKEN.encode('utf-8'))
+
+@app.before_request
+def start_profile():
+    """Profile the request if the X-TDR-Profile header asks for it or it is sampled"""
+    # Without a token nobody could read the profiles, so none are recorded
+    if not Config.PROFILE_ENABLED or not Config.PROFILE_TOKEN or request.endpoint not in PROFILED_ENDPOINTS:
+        return
+    header = request.headers.get('X-TDR-Profile')
+    if header and profile_token_ok(header):
+        trigger = 'header'
+    elif Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE:
+        trigger = 'sample'
+    else:
+        return
+    profile = RequestProfile(request.endpoint, request.method, request.path, trigger)
+    # Skipped while another request is being profiled
+    if profile.start():
+        g.profile = profile
+
+@app.after_request
+def finish_profile(response):
+    """Store the request's profile and tell the client its id"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop(response.status_code)
+        profile_buffer.add(profile)
+        response.headers['X-TDR-Profile-Id'] = profile.id
+    return response
+
+@app.teardown_request
+def discard_profile(exc):
+    """Stop the profile of a request that failed before its response was finished"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop(500)
+        profile_buffer.add(profile)
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started for latency metrics"""
+    g.request_start_time = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    """Record per-route request latency and queue the audit log entry.
+    
+    A streamed response of an audited endpoint (/api/ask) is recorded when its body has
+    been sent, with the fields its pipeline attached to the audit entry along the way.
+    """
+    start = g.pop('request_start_time', None)
+    if start is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    audited = request.endpoint in AUDITED_ENDPOINTS
+    method, status, request_g = request.method, response.status_code, g._get_current_object()
+    
+    def record():
+        elapsed = time.perf_counter() - start
+        HTTP_REQUEST_LATENCY.observe(elapsed, route=route, method=method, status=status)
+        if audited:
+            entry = {
+                'ts': datetime.utcnow().isoformat(timespec='milliseconds') + 'Z',
+                'route': route,
+                'method': method,
+                'status': status,
+                'latency_ms': round(elapsed * 1000, 3),
+                'cache': request_g.get('cache_status')
+            }
+            entry.update(request_g.get('audit', {}))
+            audit_log.record(entry)
+    
+    if audited and response.is_streamed:
+        response.call_on_close(record)
+    else:
+        record()
+    return response
+
+# Routes whose 200 GET responses carry a content-hash ETag
+ETAG_ENDPOINTS = {'proxy_api_request', 'get_endpoints', 'get_suggestions'}
+
+@app.after_request
+def finalize_response(response):
+    """Add ETags / answer conditional requests, then compress the body"""
+    if request.endpoint in ETAG_ENDPOINTS:
+        apply_etag(response, request)
+    if Config.COMPRESSION_ENABLED:
+        compress_response(response, request, Config.COMPRESSION_MIN_SIZE, Config.COMPRESSION_GZIP_LEVEL,
+                          Config.COMPRESSION_BROTLI_QUALITY)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Expose metrics in the Prometheus text format"""
+    return Response(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE_LATEST)
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'dist')
+asset_manifest = load_manifest(ASSET_DIR) if Config.UI_BUNDLE != 'false' else None
+if Config.UI_BUNDLE in ('1', 'true', 'yes') and asset_manifest is None:
+    logger.warning("TDR_UI_BUNDLE is enabled but no bundle was found in %s; "
+                   "run 'npm install && npm run build' in frontend/. Serving the development page", ASSET_DIR)
+
+@app.context_processor
+def asset_helpers():
+    return {'asset_url': lambda name: f"/assets/{asset_manifest[name]}"}
+
 @app.route('/')
 def index():
-    """Serve the main page"""
+    """Serve the main page: the precompiled bundle if built, else the in-browser transpiled page (or ?dev=1)"""
+    if asset_manifest is not None and request.args.get('dev') != '1':
+        return render_template('index_bundle.html')
     return render_template('index.html')
 
+@app.route('/assets/<path:filename>')
+def assets(filename):
+    """Serve a content-hashed file of the built UI bundle"""
+    return send_asset(ASSET_DIR, filename, request)
+
 @app.route('/debug')
 def debug():
     """Serve the debug page"""
@@ -635,14 +880,18 @@ def process_natural_language_query():
         if not query:
             return jsonify({'error': 'Query is required'}), 400
         
-        logger.info(f"Processing query: {query}")
-        
         result = nlp.process_query(query)
+        audit(query=query, processing_method=result.get('processing_method'), endpoint=result.get('endpoint'),
+              detected_language=result.get('detected_language'))
+        
+        # Rule-based matches resolve in microseconds; start the upstream fetch the UI will ask for next
+        if Config.SPECULATIVE_PREFETCH and result.get('processing_method') == 'rule_based':
+            start_speculative_prefetch(result['api_request'])
         
         return jsonify(result)
     
     except Exception as e:
-        logger.error(f"Error processing query: {str(e)}")
+        logger.error("Error processing query: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/endpoints', methods=['GET'])
@@ -695,25 +944,31 @@ def update_config():
                 # Try to fix old format (e.g., 'gpt-4o-mini' -> 'openai/gpt-4o-mini')
                 if openrouter_model.startswith('gpt-'):
                     openrouter_model = f'openai/{openrouter_model}'
-                    logger.info(f"Fixed OpenAI model format: {openrouter_model}")
+                    logger.info("Fixed OpenAI model format: %s", openrouter_model)
                 else:
                     # Default to OpenAI model
                     openrouter_model = 'openai/gpt-4o-mini'
-                    logger.warning(f"Invalid OpenAI model format, using default: {openrouter_model}")
+                    logger.warning("Invalid OpenAI model format, using default: %s", openrouter_model)
         elif ai_provider == 'deepseek':
             # Ensure DeepSeek models start with 'deepseek/'
             if not openrouter_model.startswith('deepseek/'):
                 # Default to DeepSeek model
                 openrouter_model = 'deepseek/deepseek-chat'
-                logger.warning(f"Invalid DeepSeek model format, using default: {openrouter_model}")
+                logger.warning("Invalid DeepSeek model format, using default: %s", openrouter_model)
         
         Config.update_config(hostname, api_token, openrouter_api_key, ai_provider, openrouter_model, openrouter_base_url)
+        prefetch_cache.clear()
+        response_cache.clear()
+        explanation_cache.clear()
+        snapshot_store.clear()
+        subscription_hub.close_all()
         
         # Save configuration to file
         config_data = Config.get_config_dict()
         save_success = save_config_to_file(config_data)
         
-        logger.info(f"Configuration updated: hostname={hostname}, api_token={'***' if api_token else 'None'}, openrouter_key={'***' if openrouter_api_key else 'None'}")
+        logger.info("Configuration updated: hostname=%s, api_token=%s, openrouter_key=%s",
+                    hostname, '***' if api_token else 'None', '***' if openrouter_api_key else 'None')
         
         return jsonify({
             'message': 'Configuration updated successfully' + (' and saved to file' if save_success else ' (but failed to save to file)'),
@@ -722,176 +977,772 @@ def update_config():
         })
     
     except Exception as e:
-        logger.error(f"Error updating configuration: {str(e)}")
+        logger.error("Error updating configuration: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
+# Worker pool for upstream fetches that run in the background (speculative prefetch, /api/ask)
+upstream_executor = ThreadPoolExecutor(max_workers=Config.UPSTREAM_WORKERS, thread_name_prefix='upstream')
+
+def upstream_cache_key(method: str, api_path: str, query_params: Optional[Dict] = None) -> Tuple:
+    """Cache key for an upstream request; values are compared as strings and None values are dropped"""
+    params = tuple(sorted((k, str(v)) for k, v in (query_params or {}).items() if v is not None))
+    return (Config.API_BASE_URL, method.upper(), api_path.strip('/'), params)
+
+def _discard_prefetch(key, future):
+    """Count speculative prefetches that expired without being used"""
+    SPECULATIVE_PREFETCHES.inc(result='wasted')
+
+# Speculatively started upstream GETs, keyed by upstream_cache_key and consumed by the proxy
+prefetch_cache = TTLCache('speculative_prefetch', max_entries=Config.SPECULATIVE_PREFETCH_MAX_ENTRIES,
+                          ttl=Config.SPECULATIVE_PREFETCH_TTL, on_evict=_discard_prefetch)
+
+# Upstream responses as (content, status, headers), keyed by upstream_cache_key
+response_cache = TTLCache('upstream_response', max_entries=Config.RESPONSE_CACHE_MAX_ENTRIES,
+                          ttl=Config.RESPONSE_CACHE_TTL)
+
+# Generated explanations, keyed by explainer.explanation_cache_key
+explanation_cache = TTLCache('explanation', max_entries=Config.EXPLANATION_CACHE_MAX_ENTRIES,
+                             ttl=Config.EXPLANATION_CACHE_TTL)
+
+# Latest explained snapshot per view and language, the baseline for "what changed" explanations
+snapshot_store = SnapshotStore(max_views=Config.DELTA_SNAPSHOT_MAX_VIEWS, ttl=Config.DELTA_SNAPSHOT_TTL)
+
+def snapshot_view(api_request: dict, detected_language: str) -> Tuple[Tuple, str]:
+    """Snapshot store key (the request without its date parameters) and the day the request describes"""
+    query_params = api_request.get('query_params') or {}
+    undated = {k: v for k, v in query_params.items() if not k.startswith('date')}
+    key = upstream_cache_key(api_request.get('method', 'GET'), api_request.get('url', ''), undated)
+    return key + (detected_language,), query_params.get('date[eq]') or date.today().isoformat()
+
+def record_snapshot(api_request: dict, response_data, explanation: str, detected_language: str):
+    """Remember an explained response as the baseline for later "what changed" explanations"""
+    key, as_of = snapshot_view(api_request, detected_language)
+    summary = explanation if len(explanation) <= Config.DELTA_SUMMARY_CHARS else explanation[:Config.DELTA_SUMMARY_CHARS] + '...'
+    snapshot_store.record(key, as_of, response_data, summary)
+
+def fetch_api_request(api_request: dict, operation: str = 'proxy') -> Tuple[Tuple[bytes, int, dict], bool]:
+    """fetch_cached for a built API request; aggregate requests are answered by the local threat store"""
+    if api_request.get('local'):
+        answer = query_threat_store(api_request['query_params'])
+        return (json.dumps(answer).encode('utf-8'), 200, {'Content-Type': 'application/json'}), False
+    return fetch_cached(api_request['method'], api_request['url'], api_request['query_params'], operation)
+
+def fetch_cached(method: str, api_path: str, query_params: Optional[Dict] = None,
+                 operation: str = 'proxy') -> Tuple[Tuple[bytes, int, dict], bool]:
+    """Fetch (content, status, headers) for a GET from the response cache or upstream; also returns whether it was a hit"""
+    key = upstream_cache_key(method, api_path, query_params)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached, True
+    response = fetch_upstream(method, api_path, query_params, operation=operation)
+    entry = (response.content, response.status_code, passthrough_headers(response.headers))
+    if response.ok and Config.RESPONSE_CACHE_TTL > 0:
+        response_cache.set(key, entry)
+    return entry, False
+
+def start_speculative_prefetch(api_request: dict):
+    """Start the upstream GET for a built API request in the background, unless one is already pending"""
+    if api_request['method'] != 'GET':
+        return
+    key = upstream_cache_key(api_request['method'], api_request['url'], api_request['query_params'])
+    if key in prefetch_cache:
+        return
+    future = upstream_executor.submit(fetch_upstream, api_request['method'], api_request['url'],
+                                      api_request['query_params'], None, 'prefetch')
+    prefetch_cache.set(key, future)
+    SPECULATIVE_PREFETCHES.inc(result='started')
+
+def fetch_upstream(method: str, api_path: str, query_params: Optional[Dict] = None, body: Optional[bytes] = None,
+                   operation: str = 'proxy') -> 'requests.Response':
+    """Send a request to the TDR API and record its latency and status"""
+    # Build the full API URL
+    api_url = f"{Config.API_BASE_URL}/{api_path.lstrip('/')}"
+    
+    # Add query parameters to URL
+    if query_params:
+        param_string = '&'.join([f"{k}={v}" for k, v in query_params.items() if v is not None])
+        if param_string:
+            api_url += f"?{param_string}"
+    
+    logger.debug("Proxying request to: %s", api_url)
+    
+    # Prepare headers
+    headers = {
+        'X-API-KEY': Config.API_TOKEN,
+        'Accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
+    
+    # Prepare request options
+    request_options = {
+        'headers': headers,
+        'timeout': 30
+    }
+    
+    # Add body for non-GET requests
+    if body is not None and method in ['POST', 'PUT', 'PATCH']:
+        request_options['data'] = body
+    
+    # Make the request
+    try:
+        with UPSTREAM_LATENCY.time(upstream='tdr_api', operation=operation):
+            response = requests.request(
+                method=method,
+                url=api_url,
+                **request_options
+            )
+    except requests.exceptions.RequestException:
+        UPSTREAM_RESPONSES.inc(upstream='tdr_api', status='error')
+        raise
+    UPSTREAM_RESPONSES.inc(upstream='tdr_api', status=response.status_code)
+    
+    logger.info("Proxied %s %s -> %d", method, api_path, response.status_code,
+                extra={'upstream_status': response.status_code})
+    if threat_store is not None and method == 'GET' and response.ok and api_path.lstrip('/').startswith('threats/'):
+        upstream_executor.submit(ingest_threat_data, api_path, response.content, query_params)
+    return response
+
+def ingest_threat_data(api_path: str, content: bytes, query_params: Optional[Dict] = None):
+    """Add an upstream response to the local threat store (runs off the request path)"""
+    rows = threat_store.ingest(api_path, _decode_content(content), query_params)
+    logger.debug("Threat store ingested %d rows from %s", rows, api_path)
+
+def query_threat_store(params: Dict) -> Dict:
+    """Run an aggregate query against the local threat store; raises ValueError for invalid parameters"""
+    limit = params.get('limit')
+    return threat_store.aggregate(
+        params.get('operation', ''), params.get('kind', ''), params.get('since') or None, params.get('until') or None,
+        limit=max(1, min(int(limit), 100)) if limit else 10, field=params.get('field') or 'entity'
+    )
+
+# Views fetched per day by a threat store backfill
+BACKFILL_VIEWS = [
+    ('/threats/users', {'limit': 100}),
+    ('/threats/devices', {'limit': 100}),
+    ('/threats/rare-processes', {'limit': 100}),
+    ('/threats/org/summary', {}),
+]
+backfill_lock = threading.Lock()
+
+def backfill_threat_store(days: int):
+    """Fetch the list views of the past days so the threat store covers them"""
+    if not backfill_lock.acquire(blocking=False):
+        return
+    try:
+        today = date.today()
+        for offset in range(days):
+            day = (today - timedelta(days=offset)).isoformat()
+            for path, params in BACKFILL_VIEWS:
+                # Responses are ingested by fetch_upstream like any other /threats/* response
+                try:
+                    fetch_upstream('GET', path, {**params, 'date[eq]': day}, operation='backfill')
+                except requests.exceptions.RequestException as e:
+                    logger.warning("Threat store backfill failed for %s on %s: %s", path, day, e)
+        logger.info("Threat store backfill of %d days finished", days)
+    finally:
+        backfill_lock.release()
+
+def reformat_upstream(entry: Tuple[bytes, int, dict], fields: Optional[List[str]], output_format: Optional[str]):
+    """Apply a fields= projection and format= encoding to an upstream (content, status, headers) entry.
+    
+    The body is parsed once and re-encoded without whitespace; error and non-JSON responses pass through unchanged.
+    """
+    content, status, headers = entry
+    if not output_format or status >= 400:
+        return entry
+    try:
+        data = response_format.loads(content)
+    except ValueError:
+        return entry
+    body, mimetype = response_format.encode(response_format.project(data, fields), output_format)
+    return body, status, {'Content-Type': mimetype}
+
 @app.route('/api/proxy/<path:api_path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def proxy_api_request(api_path):
     """Proxy API requests to bypass CORS issues"""
     try:
-        # Build the full API URL
-        api_url = f"{Config.API_BASE_URL}/{api_path}"
-        logger.info(f"Building API URL: {api_url}")
-        
-        # Get query parameters from the request
-        query_params = request.args
-        
-        # Add query parameters to URL
-        if query_params:
-            param_string = '&'.join([f"{k}={v}" for k, v in query_params.items()])
-            api_url += f"?{param_string}"
-        
-        logger.info(f"Proxying request to: {api_url}")
-        
-        # Prepare headers
-        headers = {
-            'X-API-KEY': Config.API_TOKEN,
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
-        
-        # Prepare request options
-        request_options = {
-            'headers': headers,
-            'timeout': 30
-        }
+        # Get query parameters from the request; fields= and format= are handled here, not upstream
+        query_params = request.args.to_dict()
+        audit(endpoint=f"/{api_path}", query_params=query_params)
+        fields = response_format.parse_fields(query_params.pop('fields', None))
+        output_format = query_params.pop('format', None) or ('compact' if fields else None)
+        if output_format and output_format not in response_format.FORMATS:
+            return jsonify({'error': f"Unsupported format '{output_format}'",
+                            'supported': list(response_format.FORMATS)}), 400
         
-        # Add body for non-GET requests
-        if request.method in ['POST', 'PUT', 'PATCH']:
-            request_options['data'] = request.get_data()
+        future = None
+        if request.method == 'GET':
+            key = upstream_cache_key(request.method, api_path, query_params)
+            cached = response_cache.get(key)
+            if cached is not None:
+                g.cache_status = 'hit'
+                audit(upstream_status=cached[1])
+                return reformat_upstream(cached, fields, output_format)
+            if Config.SPECULATIVE_PREFETCH:
+                future = prefetch_cache.pop(key)
+            g.cache_status = 'prefetch' if future is not None else 'miss'
+        response = None
+        if future is not None:
+            try:
+                response = future.result()
+                SPECULATIVE_PREFETCHES.inc(result='used')
+            except Exception as e:
+                # The prefetch failed; the request goes upstream itself
+                logger.warning("Speculative prefetch of %s failed: %s", api_path, e)
+                SPECULATIVE_PREFETCHES.inc(result='failed')
+                g.cache_status = 'miss'
+        if response is None:
+            response = fetch_upstream(request.method, api_path, query_params, request.get_data())
+        audit(upstream_status=response.status_code)
         
-        # Make the request
-        response = requests.request(
-            method=request.method,
-            url=api_url,
-            **request_options
-        )
-        
-        logger.info(f"API response status: {response.status_code}")
+        entry = (response.content, response.status_code, passthrough_headers(response.headers))
+        if request.method == 'GET' and response.ok and Config.RESPONSE_CACHE_TTL > 0:
+            response_cache.set(key, entry)
         
         # Return the response
-        return response.content, response.status_code, dict(response.headers)
+        return reformat_upstream(entry, fields, output_format)
         
     except requests.exceptions.RequestException as e:
-        logger.error(f"Proxy request failed: {str(e)}")
+        logger.error("Proxy request failed: %s", e)
         return jsonify({'error': f'Proxy request failed: {str(e)}'}), 500
     except Exception as e:
-        logger.error(f"Proxy error: {str(e)}")
+        logger.error("Proxy error: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/api/ai-explain', methods=['POST'])
 def ai_explain_response():
     """Use AI to explain API response in natural language"""
     try:
-        logger.info("=== AI EXPLAIN ENDPOINT CALLED ===")
         data = request.get_json()
-        logger.info(f"Received data keys: {list(data.keys()) if data else 'None'}")
+        logger.debug("AI explain called with data keys: %s", list(data.keys()) if data else None)
         
-        prompt = data.get('prompt')
+        prompt = custom_prompt = data.get('prompt')
         response_data = data.get('responseData')
         api_request = data.get('apiRequest')
         detected_language = data.get('detected_language', 'en')
+        delta_mode = data.get('mode') == 'delta'
+        audit(endpoint=(api_request or {}).get('url'), detected_language=detected_language,
+              prompt_chars=len(prompt) if prompt else 0, mode='delta' if delta_mode else 'full')
         
-        logger.info(f"Prompt length: {len(prompt) if prompt else 0}")
-        logger.info(f"Response data type: {type(response_data)}")
-        logger.info(f"API request: {api_request}")
+        logger.debug("Prompt length: %d, response data type: %s", len(prompt) if prompt else 0, type(response_data).__name__)
         
-        if not prompt:
+        has_data = bool(api_request) and response_data is not None
+        if not prompt and not has_data:
             logger.error("No prompt provided")
             return jsonify({'error': 'No prompt provided'}), 400
+        if delta_mode and not has_data:
+            return jsonify({'error': 'Delta mode requires apiRequest and responseData'}), 400
         
-        logger.info(f"Processing AI explanation for {api_request.get('method', 'GET')} {api_request.get('url', 'unknown')}")
-        logger.info(f"Detected language: {detected_language}")
-        logger.info(f"AI API Key configured: {bool(Config.OPENAI_API_KEY)}")
-        logger.info(f"AI Model: {Config.OPENAI_MODEL}")
-        logger.info(f"AI Base URL: {Config.OPENAI_BASE_URL}")
-        
-        # Modify prompt based on detected language
-        language_prompts = {
-            'zh': "你是一名网络安全分析师，专门解释威胁检测和响应(TDR)数据。请提供清晰、专业的安全数据解释，帮助安全管理人员理解威胁并采取适当的行动。请用简体中文回答。",
-            'zh-tw': "您是一名網路安全分析師，專門解釋威脅偵測和回應(TDR)資料。請提供清晰、專業的安全資料解釋，幫助安全管理人員理解威脅並採取適當的行動。請用繁體中文回答。",
-            'ja': "あなたは脅威検出および対応（TDR）データを説明する専門のサイバーセキュリティアナリストです。セキュリティ管理者が脅威を理解し、適切な行動を取れるよう、明確で専門的なセキュリティデータの説明を提供してください。日本語で回答してください。",
-            'ko': "당신은 위협 탐지 및 대응(TDR) 데이터를 설명하는 전문 사이버보안 분석가입니다. 보안 관리자가 위협을 이해하고 적절한 조치를 취할 수 있도록 명확하고 전문적인 보안 데이터 설명을 제공해 주세요. 한국어로 답변해 주세요.",
-            'ar': "أنت محلل أمن سيبراني متخصص في شرح بيانات اكتشاف التهديدات والاستجابة (TDR). قدم شرحًا واضحًا ومهنيًا لبيانات الأمان لمساعدة مدراء الأمن على فهم التهديدات واتخاذ الإجراءات المناسبة. أجب باللغة العربية.",
-            'ru': "Вы эксперт-аналитик по кибербезопасности, специализирующийся на объяснении данных обнаружения и реагирования на угрозы (TDR). Предоставляйте четкие, профессиональные объяснения данных безопасности, чтобы помочь менеджерам по безопасности понять угрозы и принять соответствующие меры. Отвечайте на русском языке.",
-            'en': "You are a cybersecurity analyst expert in threat detection and response. Provide clear, professional explanations of security data that help security managers understand threats and take appropriate action."
-        }
+        logger.info("Processing AI explanation for %s %s (language: %s)", (api_request or {}).get('method', 'GET'),
+                    (api_request or {}).get('url', 'unknown'), detected_language)
+        logger.debug("AI API key configured: %s, model: %s, base URL: %s",
+                     bool(Config.OPENAI_API_KEY), Config.OPENAI_MODEL, Config.OPENAI_BASE_URL)
         
-        system_prompt = language_prompts.get(detected_language, language_prompts['en'])
+        # In delta mode, explain only the changes since the last explained snapshot of the same view
+        baseline, diff, result_extra = None, None, {'mode': 'full'}
+        if delta_mode:
+            view_key, as_of = snapshot_view(api_request, detected_language)
+            baseline = snapshot_store.baseline(view_key, as_of)
+            if baseline is not None:
+                diff = diff_snapshots(baseline['data'], response_data, ignore_fields=('date',))
+                prompt = build_delta_prompt(diff, baseline['summary'], api_request, baseline['as_of'], as_of)
+                custom_prompt = None
+                result_extra = {
+                    'mode': 'delta',
+                    'baseline_date': baseline['as_of'],
+                    'changes': {k: len((diff or {}).get(k, ())) for k in ('added', 'removed', 'changed')}
+                }
+                logger.info("Delta explanation against %s (prompt %d chars)", baseline['as_of'], len(prompt))
+        if not prompt:
+            prompt = build_explanation_prompt(response_data, api_request, detected_language)
+        
+        # Reuse a cached explanation of the same data (e.g. pre-warmed by the scheduler)
+        cache_key = None
+        if has_data:
+            cache_key = explanation_cache_key(api_request, response_data, detected_language, custom_prompt)
+            if baseline is not None:
+                cache_key += ('delta', baseline['as_of'])
+            cached = explanation_cache.get(cache_key)
+            g.cache_status = 'hit' if cached is not None else 'miss'
+            if cached is not None:
+                return jsonify({'explanation': cached, 'success': True, 'cached': True, **result_extra})
         
         # Use OpenAI/OpenRouter to generate explanation
         try:
-            logger.info("Creating AI client...")
-            logger.info(f"Using base URL: {Config.OPENAI_BASE_URL}")
-            
-            # Prepare headers for OpenRouter (optional but recommended)
-            extra_headers = {
-                "HTTP-Referer": "https://github.com/yourusername/tdr-agent",  # Optional: Your app URL
-                "X-Title": "TDR Agent"  # Optional: Your app name
-            }
-            
-            client = openai.OpenAI(
-                api_key=Config.OPENAI_API_KEY,
-                base_url=Config.OPENAI_BASE_URL,
-                default_headers=extra_headers
-            )
-            
-            logger.info("Sending request to AI service...")
-            logger.info(f"Request prompt preview: {prompt[:200]}...")
-            
-            response = client.chat.completions.create(
-                model=Config.OPENAI_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            logger.debug("Sending request to AI service, prompt: %s", truncate(prompt))
             
-            explanation = response.choices[0].message.content
-            logger.info("AI explanation generated successfully")
-            logger.info(f"Explanation length: {len(explanation)} characters")
-            logger.info(f"Explanation preview: {explanation[:200]}...")
+            explanation = generate_explanation(prompt, detected_language,
+                                               operation='explain_delta' if baseline is not None else 'explain')
+            logger.info("AI explanation generated (%d characters)", len(explanation))
+            logger.debug("Explanation: %s", truncate(explanation))
+            if cache_key is not None:
+                explanation_cache.set(cache_key, explanation)
+            if cache_key is not None and not custom_prompt:
+                # A delta explanation only describes changes; carry the last full review forward as the summary
+                summary = baseline['summary'] if baseline is not None else explanation
+                record_snapshot(api_request, response_data, summary, detected_language)
             
             result = {
                 'explanation': explanation,
-                'success': True
+                'success': True,
+                **result_extra
             }
-            logger.info(f"Returning result: {result}")
             return jsonify(result)
             
         except Exception as ai_error:
-            logger.error(f"AI API error: {str(ai_error)}")
-            logger.error(f"AI error type: {type(ai_error)}")
+            logger.error("AI API error (%s): %s", type(ai_error).__name__, ai_error)
             return jsonify({
                 'error': f'AI processing failed: {str(ai_error)}',
                 'success': False
             }), 500
             
     except Exception as e:
-        logger.error(f"AI explain endpoint error: {str(e)}")
-        logger.error(f"Error type: {type(e)}")
+        logger.error("AI explain endpoint error (%s): %s", type(e).__name__, e)
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+def _ndjson(event: dict) -> str:
+    """Serialize one pipeline event as a newline-delimited JSON line"""
+    return json.dumps(event, ensure_ascii=False, default=str) + '\n'
+
+def _decode_content(content: bytes):
+    """Decode an upstream body as JSON, falling back to text"""
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content.decode('utf-8', errors='replace')
+
+def run_ask_pipeline(query: str, explain: bool = True):
+    """Parse, fetch and explain a query, yielding one event dict per stage as soon as it is ready"""
+    timings = {}
+    started = time.perf_counter()
+    
+    result = nlp.process_query(query)
+    timings['parse_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    audit(processing_method=result.get('processing_method'), endpoint=result.get('endpoint'))
+    if 'error' in result:
+        yield {'event': 'error', 'stage': 'parse', 'error': result['error'], 'suggestions': result.get('suggestions', [])}
+        yield {'event': 'done', 'timings': timings}
+        return
+    
+    # Start the upstream fetch before the parsed result is serialized and sent to the client
+    api_request = result['api_request']
+    fetch_started = time.perf_counter()
+    future = upstream_executor.submit(fetch_api_request, api_request, 'ask')
+    yield {'event': 'parsed', 'result': result}
+    
+    try:
+        (content, status, _), cache_hit = future.result()
+    except requests.exceptions.RequestException as e:
+        logger.error("Ask pipeline upstream request failed: %s", e)
+        yield {'event': 'error', 'stage': 'fetch', 'error': f'Proxy request failed: {str(e)}'}
+        yield {'event': 'done', 'timings': timings}
+        return
+    response_data = _decode_content(content)
+    timings['fetch_ms'] = round((time.perf_counter() - fetch_started) * 1000, 2)
+    g.cache_status = 'hit' if cache_hit else 'miss'
+    audit(upstream_status=status)
+    yield {'event': 'data', 'status': status, 'data': response_data, 'cached': cache_hit}
+    
+    if explain and status < 400:
+        language = result['detected_language']
+        cache_key = explanation_cache_key(api_request, response_data, language)
+        cached_explanation = explanation_cache.get(cache_key)
+        if cached_explanation is not None:
+            yield {'event': 'explanation', 'delta': cached_explanation, 'cached': True}
+        elif not Config.OPENAI_API_KEY:
+            yield {'event': 'error', 'stage': 'explain', 'error': 'AI API key not configured'}
+        else:
+            explain_started = time.perf_counter()
+            prompt = build_explanation_prompt(response_data, api_request, language)
+            deltas = []
+            try:
+                for delta in stream_explanation(prompt, language):
+                    if 'first_token_ms' not in timings:
+                        timings['first_token_ms'] = round((time.perf_counter() - explain_started) * 1000, 2)
+                    deltas.append(delta)
+                    yield {'event': 'explanation', 'delta': delta}
+                explanation_cache.set(cache_key, ''.join(deltas))
+                record_snapshot(api_request, response_data, ''.join(deltas), language)
+            except Exception as e:
+                logger.error("Ask pipeline explanation failed (%s): %s", type(e).__name__, e)
+                yield {'event': 'error', 'stage': 'explain', 'error': f'AI processing failed: {str(e)}'}
+            timings['explain_ms'] = round((time.perf_counter() - explain_started) * 1000, 2)
+    
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    yield {'event': 'done', 'timings': timings}
+
+@app.route('/api/ask', methods=['POST'])
+def ask():
+    """Parse a natural language query, fetch its data and explain it in a single round trip.
+    
+    With "stream" (the default) the response is newline-delimited JSON with one event per
+    stage: parsed, data, explanation deltas and done (plus error events). Otherwise the
+    stages are collected into a single JSON object.
+    """
+    data = request.get_json(silent=True) or {}
+    query = (data.get('query') or '').strip()
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    explain = bool(data.get('explain', True))
+    audit(query=query, explain=explain)
+    
+    events = run_ask_pipeline(query, explain)
+    if data.get('stream', True):
+        return Response(stream_with_context(_ndjson(event) for event in events),
+                        mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    combined = {'errors': []}
+    explanation = []
+    for event in events:
+        kind = event['event']
+        if kind == 'parsed':
+            combined['parsed'] = event['result']
+        elif kind == 'data':
+            combined['status'] = event['status']
+            combined['data'] = event['data']
+        elif kind == 'explanation':
+            explanation.append(event['delta'])
+        elif kind == 'error':
+            combined['errors'].append({k: v for k, v in event.items() if k != 'event'})
+        elif kind == 'done':
+            combined['timings'] = event['timings']
+    if explanation:
+        combined['explanation'] = ''.join(explanation)
+    return jsonify(combined)
+
+# List endpoint -> (field holding the entity ID in each item, per-entity summary path, whether it takes date[eq])
+DRILLDOWN_ENDPOINTS = {
+    'threats/users': ('user', '/threats/users/{}/summary', True),
+    'threats/devices': ('device', '/threats/devices/{}/summary', True),
+    'threats/rare-processes': ('id', '/threats/rare-processes/{}/summary', False),
+}
+
+def _risk_score(item: dict) -> float:
+    """Numeric risk of a list entry; missing or malformed scores rank last"""
+    try:
+        return float(item.get('risk') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _drilldown_entities(list_data: dict, id_field: str, limit: int) -> List[dict]:
+    """The top entries of a list response, most risky first"""
+    items = [item for item in list_data.get('data') or [] if isinstance(item, dict) and item.get(id_field) is not None]
+    items.sort(key=_risk_score, reverse=True)
+    return items[:limit]
+
+@app.route('/api/drilldown', methods=['POST'])
+def drilldown():
+    """Fetch the per-entity summaries for the top entries of a list and explain them in one LLM call.
+    
+    Accepts either a natural language "query" resolving to a list endpoint, or the "apiRequest"
+    of a list endpoint with its "responseData" (fetched if omitted). "limit" caps the number of
+    entities and "explain" (default true) controls the batched explanation.
+    """
+    started = time.perf_counter()
+    data = request.get_json(silent=True) or {}
+    api_request = data.get('apiRequest')
+    list_data = data.get('responseData')
+    detected_language = data.get('detected_language', 'en')
+    if data.get('query'):
+        query = data['query'].strip()
+        result = nlp.process_query(query)
+        api_request = result.get('api_request')
+        detected_language = result.get('detected_language', detected_language)
+        # "Describe the top 10 risky users" may be parsed as a single-entity summary; drill down into its list
+        match = re.match(r'/?(threats/[\w-]+)/[^/]+/summary/?$', (api_request or {}).get('url', ''))
+        if match and match.group(1) in DRILLDOWN_ENDPOINTS:
+            api_request = {**api_request, 'url': '/' + match.group(1),
+                           'query_params': {**api_request.get('query_params', {}),
+                                            'limit': nlp._extract_limit(query.lower(), Config.DRILLDOWN_DEFAULT_LIMIT)}}
+    if not api_request:
+        return jsonify({'error': 'A query or apiRequest is required'}), 400
+    
+    list_path = api_request.get('url', '').strip('/')
+    if list_path not in DRILLDOWN_ENDPOINTS:
+        return jsonify({'error': f'Drill-down is not supported for /{list_path}',
+                        'supported': ['/' + path for path in DRILLDOWN_ENDPOINTS]}), 400
+    id_field, summary_path, dated = DRILLDOWN_ENDPOINTS[list_path]
+    list_params = {k: v for k, v in (api_request.get('query_params') or {}).items() if v is not None}
+    try:
+        limit = max(1, min(int(data.get('limit') or list_params.get('limit') or Config.DRILLDOWN_DEFAULT_LIMIT),
+                           Config.DRILLDOWN_MAX_ENTITIES))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit must be an integer'}), 400
+    audit(endpoint=f"/{list_path}", query=data.get('query'), limit=limit, detected_language=detected_language)
+    if list_data is not None and not isinstance(list_data, dict):
+        return jsonify({'error': 'responseData must be the JSON object returned by the list endpoint'}), 400
+    
+    try:
+        if list_data is None:
+            (content, status, _), _ = fetch_cached('GET', list_path, list_params, operation='drilldown')
+            if status >= 400:
+                return jsonify({'error': f'List request failed with status {status}'}), 502
+            list_data = _decode_content(content)
+            if not isinstance(list_data, dict):
+                return jsonify({'error': 'List request returned an unexpected (non-JSON object) body'}), 502
+        
+        # Fetch every per-entity summary concurrently
+        items = _drilldown_entities(list_data, id_field, limit)
+        summary_params = {'date[eq]': list_params['date[eq]']} if dated and list_params.get('date[eq]') else {}
+        futures = [
+            upstream_executor.submit(fetch_cached, 'GET', summary_path.format(requests.utils.quote(str(item[id_field]), safe='')),
+                                     summary_params, 'drilldown')
+            for item in items
+        ]
+        entities = []
+        for item, future in zip(items, futures):
+            entity = {'entity': item[id_field], 'risk': item.get('risk')}
+            try:
+                (content, status, _), _ = future.result()
+                summary = _decode_content(content)
+                if status >= 400:
+                    entity['error'] = f'Status {status}'
+                elif isinstance(summary, dict):
+                    # The entity ID and date are already known from the list
+                    details = {k: v for k, v in summary.items() if k not in (id_field, 'date')}
+                    entity['summary'] = details['summary'] if list(details) == ['summary'] else details
+                else:
+                    entity['summary'] = summary
+            except requests.exceptions.RequestException as e:
+                entity['error'] = str(e)
+            entities.append(entity)
+    except requests.exceptions.RequestException as e:
+        logger.error("Drill-down upstream request failed: %s", e)
+        return jsonify({'error': f'Proxy request failed: {str(e)}'}), 500
+    timings = {'fetch_ms': round((time.perf_counter() - started) * 1000, 2)}
+    result = {'success': True, 'api_request': {'method': 'GET', 'url': f"/{list_path}", 'query_params': list_params},
+              'entities': entities, 'timings': timings}
+    
+    if data.get('explain', True) and entities:
+        drilldown_request = {'method': 'GET', 'url': f"/{list_path}#drilldown", 'query_params': list_params}
+        cache_key = explanation_cache_key(drilldown_request, entities, detected_language)
+        explanation = explanation_cache.get(cache_key)
+        g.cache_status = 'hit' if explanation is not None else 'miss'
+        if explanation is None:
+            if not Config.OPENAI_API_KEY:
+                return jsonify({**result, 'error': 'AI API key not configured'})
+            explain_started = time.perf_counter()
+            try:
+                explanation = generate_explanation(build_drilldown_prompt(entities, result['api_request']),
+                                                   detected_language, operation='explain_drilldown')
+            except Exception as e:
+                logger.error("Drill-down explanation failed (%s): %s", type(e).__name__, e)
+                return jsonify({**result, 'success': False, 'error': f'AI processing failed: {str(e)}'}), 500
+            explanation_cache.set(cache_key, explanation)
+            timings['explain_ms'] = round((time.perf_counter() - explain_started) * 1000, 2)
+        result['explanation'] = explanation
+        result['cached'] = g.cache_status == 'hit'
+    
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    logger.info("Drill-down of /%s: %d entities in %.0f ms", list_path, len(entities), timings['total_ms'])
+    return jsonify(result)
+
+subscription_hub = SubscriptionHub(Config.SUBSCRIPTION_INTERVAL, max_pollers=Config.SUBSCRIPTION_MAX_POLLERS,
+                                   queue_size=Config.SUBSCRIPTION_QUEUE_SIZE)
+
+def _fetch_snapshot(api_path: str, query_params: Dict):
+    """Fetch one view for a subscription poller, raising on upstream errors"""
+    response = fetch_upstream('GET', api_path, query_params, operation='subscribe')
+    response.raise_for_status()
+    return _decode_content(response.content)
+
+def _sse(event: str, payload) -> str:
+    """Serialize one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+@app.route('/api/subscribe/<path:api_path>', methods=['GET'])
+def subscribe(api_path):
+    """Stream a view's snapshot and subsequent changes as server-sent events"""
+    query_params = request.args.to_dict()
+    # Keyed like the response cache, so every viewer of the same view on the same host shares one poller
+    key = upstream_cache_key('GET', api_path, query_params)
+    try:
+        poller, subscriber = subscription_hub.subscribe(key, lambda: _fetch_snapshot(api_path, query_params))
+    except PollerLimitReached as e:
+        return jsonify({'error': str(e)}), 503
+    logger.info("Subscribed to /%s (%d subscribers)", api_path, poller.subscriber_count())
+    
+    def generate():
+        try:
+            while True:
+                try:
+                    item = subscriber.get(timeout=Config.SUBSCRIPTION_HEARTBEAT)
+                except queue.Empty:
+                    # Comment line; keeps proxies from timing out and detects closed connections
+                    yield ': keep-alive\n\n'
+                    continue
+                if item is CLOSED:
+                    return
+                yield _sse(*item)
+        finally:
+            subscription_hub.unsubscribe(poller, subscriber)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/subscriptions', methods=['GET'])
+def subscription_stats():
+    """Get the number of active pollers and subscribers"""
+    return jsonify(subscription_hub.stats())
+
+# Standard daily views pre-warmed by the scheduler, as built by _build_api_request for default queries
+PREWARM_VIEWS = [
+    ('/threats/org/summary', {}),
+    ('/threats/users', {'limit': Config.PREWARM_LIMIT}),
+    ('/threats/devices', {'limit': Config.PREWARM_LIMIT}),
+    ('/threats/rare-processes', {'limit': Config.PREWARM_LIMIT}),
+]
+
+def prewarm_caches():
+    """Fetch today's and yesterday's standard views into the response cache and pre-generate their explanations"""
+    languages = [language.strip() for language in Config.PREWARM_LANGUAGES.split(',') if language.strip()]
+    today = date.today()
+    for path, params in PREWARM_VIEWS:
+        # No date is what a plain "show me ..." query sends; explicit dates cover "yesterday" and dated queries
+        for day in (None, today - timedelta(days=1), today):
+            query_params = dict(params)
+            if day is not None:
+                query_params['date[eq]'] = day.isoformat()
+            try:
+                response = fetch_upstream('GET', path, query_params, operation='prewarm')
+            except requests.exceptions.RequestException as e:
+                logger.warning("Pre-warm fetch failed for %s: %s", path, e)
+                continue
+            if not response.ok:
+                continue
+            # Only a past day is final; undated and today's views keep changing upstream
+            ttl = Config.PREWARM_TTL if day is not None and day < today else Config.PREWARM_OPEN_DAY_TTL
+            response_cache.set(upstream_cache_key('GET', path, query_params),
+                               (response.content, response.status_code, passthrough_headers(response.headers)), ttl=ttl)
+            
+            if not Config.OPENAI_API_KEY:
+                continue
+            response_data = _decode_content(response.content)
+            api_request = {'method': 'GET', 'url': path, 'query_params': query_params}
+            for language in languages:
+                cache_key = explanation_cache_key(api_request, response_data, language)
+                if cache_key in explanation_cache:
+                    continue
+                try:
+                    prompt = build_explanation_prompt(response_data, api_request, language)
+                    explanation = generate_explanation(prompt, language)
+                    explanation_cache.set(cache_key, explanation, ttl=Config.PREWARM_TTL)
+                    record_snapshot(api_request, response_data, explanation, language)
+                except Exception as e:
+                    logger.warning("Pre-warm explanation failed for %s (%s): %s", path, language, e)
+
+prewarm_scheduler = DailyScheduler('prewarm', parse_times(Config.PREWARM_TIMES), prewarm_caches)
+
+@app.route('/api/prewarm', methods=['POST'])
+def trigger_prewarm():
+    """Start a cache pre-warming run in the background"""
+    if prewarm_scheduler.is_running():
+        return jsonify({'message': 'Pre-warming already in progress'}), 409
+    threading.Thread(target=prewarm_scheduler.run_now, name='prewarm-manual', daemon=True).start()
+    return jsonify({'message': 'Pre-warming started'}), 202
+
+@app.route('/api/prewarm', methods=['GET'])
+def prewarm_status():
+    """Get the pre-warming schedule and cache sizes"""
+    next_run = prewarm_scheduler.next_run()
+    return jsonify({
+        'running': prewarm_scheduler.is_running(),
+        'last_run': prewarm_scheduler.last_run.isoformat() if prewarm_scheduler.last_run else None,
+        'next_run': next_run.isoformat() if next_run else None,
+        'response_cache_entries': len(response_cache),
+        'explanation_cache_entries': len(explanation_cache)
+    })
+
+def profiles_unavailable():
+    """Error response if profiling is disabled or the profiling token is missing, else None"""
+    if not Config.PROFILE_ENABLED:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if not Config.PROFILE_TOKEN:
+        return jsonify({'error': 'TDR_PROFILE_TOKEN must be set to read profiles'}), 403
+    if not profile_token_ok(request.headers.get('X-TDR-Profile')):
+        return jsonify({'error': 'Invalid or missing X-TDR-Profile token'}), 403
+    return None
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """List the most recent request profiles"""
+    error = profiles_unavailable()
+    if error:
+        return error
+    return jsonify({'sample_rate': Config.PROFILE_SAMPLE_RATE, 'profiles': profile_buffer.list()})
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Get the spans and top functions of a request profile"""
+    error = profiles_unavailable()
+    if error:
+        return error
+    profile = profile_buffer.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    try:
+        limit = max(1, int(request.args.get('limit', 30)))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify(profile.to_dict(request.args.get('sort', 'cumulative'), limit))
+
+@app.route('/api/profiles/<profile_id>/pstats', methods=['GET'])
+def download_profile(profile_id):
+    """Download the CPU profile of a request as a pstats file"""
+    error = profiles_unavailable()
+    if error:
+        return error
+    profile = profile_buffer.get(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return Response(profile.dump_stats(), mimetype='application/octet-stream',
+                    headers={'Content-Disposition': f'attachment; filename=profile-{profile.id}.pstats'})
+
+@app.route('/api/store', methods=['GET'])
+def threat_store_stats():
+    """Get the contents of the local threat store"""
+    if threat_store is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, 'backfill_running': backfill_lock.locked(), 'tables': threat_store.stats()})
+
+@app.route('/api/store/query', methods=['GET'])
+def threat_store_query():
+    """Answer a count, top or trend query from the local threat store"""
+    if threat_store is None:
+        return jsonify({'error': 'Threat store is disabled'}), 404
+    try:
+        return jsonify(query_threat_store(request.args.to_dict()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/store/backfill', methods=['POST'])
+def threat_store_backfill():
+    """Start filling the local threat store with the list views of the past days"""
+    if threat_store is None:
+        return jsonify({'error': 'Threat store is disabled'}), 404
+    data = request.get_json(silent=True) or {}
+    try:
+        days = max(1, min(int(data.get('days', Config.THREAT_STORE_BACKFILL_DAYS)), 366))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'days must be an integer'}), 400
+    if backfill_lock.locked():
+        return jsonify({'message': 'Backfill already in progress'}), 409
+    threading.Thread(target=backfill_threat_store, args=(days,), name='threat-store-backfill', daemon=True).start()
+    return jsonify({'message': f'Backfill of {days} days started'}), 202
+
 @app.route('/api/test-ai')
 def test_ai():
     """Test AI configuration and connectivity"""
     try:
-        logger.info("=== AI TEST ENDPOINT CALLED ===")
+        logger.info("AI test endpoint called")
         
         # Check configuration
         has_api_key = bool(Config.OPENAI_API_KEY)
         model = Config.OPENAI_MODEL
         base_url = Config.OPENAI_BASE_URL
         
-        logger.info(f"AI API Key configured: {has_api_key}")
-        logger.info(f"AI Model: {model}")
-        logger.info(f"AI Base URL: {base_url}")
+        logger.info("AI API key configured: %s, model: %s, base URL: %s", has_api_key, model, base_url)
         
         if not has_api_key:
             return jsonify({
@@ -903,19 +1754,8 @@ def test_ai():
         
         # Test AI connection (OpenRouter/OpenAI)
         try:
-            logger.info(f"Using base URL: {Config.OPENAI_BASE_URL}")
-            
-            # Prepare headers for OpenRouter (optional but recommended)
-            extra_headers = {
-                "HTTP-Referer": "https://github.com/yourusername/tdr-agent",  # Optional: Your app URL
-                "X-Title": "TDR Agent"  # Optional: Your app name
-            }
-            
-            client = openai.OpenAI(
-                api_key=Config.OPENAI_API_KEY,
-                base_url=Config.OPENAI_BASE_URL,
-                default_headers=extra_headers
-            )
+            # Create OpenAI client with OpenRouter base URL and headers
+            client = create_client()
             
             response = client.chat.completions.create(
                 model=Config.OPENAI_MODEL,
@@ -932,7 +1772,7 @@ def test_ai():
             )
             
             result = response.choices[0].message.content
-            logger.info(f"AI test successful: {result}")
+            logger.info("AI test successful: %s", truncate(result))
             
             return jsonify({
                 'success': True,
@@ -944,7 +1784,7 @@ def test_ai():
             })
             
         except Exception as ai_error:
-            logger.error(f"AI test failed: {str(ai_error)}")
+            logger.error("AI test failed: %s", ai_error)
             return jsonify({
                 'error': f'AI test failed: {str(ai_error)}',
                 'has_api_key': True,
@@ -954,7 +1794,7 @@ def test_ai():
             }), 500
             
     except Exception as e:
-        logger.error(f"AI test endpoint error: {str(e)}")
+        logger.error("AI test endpoint error: %s", e)
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
 @app.route('/api/test-proxy')
@@ -962,7 +1802,7 @@ def test_proxy():
     """Test proxy functionality"""
     try:
         test_url = f"{Config.API_BASE_URL}/threats/users"
-        logger.info(f"Testing proxy with URL: {test_url}")
+        logger.info("Testing proxy with URL: %s", test_url)
         
         headers = {
             'X-API-KEY': Config.API_TOKEN,
@@ -970,7 +1810,7 @@ def test_proxy():
         }
         
         response = requests.get(test_url, headers=headers, timeout=10)
-        logger.info(f"Test response status: {response.status_code}")
+        logger.info("Test response status: %d", response.status_code)
         
         return jsonify({
             'message': 'Proxy test successful',
@@ -980,15 +1820,28 @@ def test_proxy():
         })
         
     except Exception as e:
-        logger.error(f"Proxy test failed: {str(e)}")
+        logger.error("Proxy test failed: %s", e)
         return jsonify({
             'error': f'Proxy test failed: {str(e)}',
             'url': f"{Config.API_BASE_URL}/threats/users"
         }), 500
 
+def start_background_threads():
+    """Start the audit log writer and the pre-warm scheduler in the process that serves requests"""
+    if Config.AUDIT_LOG_ENABLED:
+        audit_log.start()
+    prewarm_scheduler.start()
+
+if __name__ != '__main__':
+    # Imported by a WSGI server
+    start_background_threads()
+
 if __name__ == '__main__':
     # Fix for Windows socket error
-    import os
+    use_reloader = os.name != 'nt'
+    # With the reloader this process only watches for changes; the serving child has WERKZEUG_RUN_MAIN set
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_threads()
     if os.name == 'nt':  # Windows
         app.run(debug=True, host='127.0.0.1', port=5000, use_reloader=False)
     else:  # Unix/Linux/Mac
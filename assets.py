@@ -0,0 +1,49 @@
+import json
+import logging
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from flask import Request, Response, send_from_directory
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+# Built files carry a content hash in their name, so browsers may keep them for a year without revalidating
+IMMUTABLE_MAX_AGE = 365 * 86400
+
+# Precompressed siblings written by frontend/build.mjs, in order of preference
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+def load_manifest(directory: str) -> Optional[Dict[str, str]]:
+    """Map of logical asset names to hashed file names from a built bundle, or None if there is none"""
+    path = os.path.join(directory, 'manifest.json')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable asset manifest %s: %s", path, e)
+        return None
+
+
+def send_asset(directory: str, filename: str, request: Request) -> Response:
+    """Serve a built asset with long-lived immutable caching, precompressed if the client accepts it"""
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for coding, suffix in PRECOMPRESSED:
+        path = safe_join(directory, filename + suffix)
+        if request.accept_encodings[coding] and path and os.path.isfile(path):
+            encoding, filename = coding, filename + suffix
+            break
+    response = send_from_directory(directory, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        # Would otherwise name the .br/.gz file
+        response.headers.pop('Content-Disposition', None)
+    return response
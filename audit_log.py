@@ -0,0 +1,109 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from metrics import AUDIT_LOG_RECORDS
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogWriter:
+    """Background writer that appends one JSON line per handled request.
+
+    `record()` only does a non-blocking put on a bounded queue, so request
+    handlers never wait on disk I/O. A daemon thread drains the queue in
+    batches, writes them with a single fsync per batch and rotates the file
+    once it exceeds `max_bytes`. When the queue is full the entry is dropped
+    and counted in `tdr_audit_log_records_total{result="dropped"}`.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 3):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background writer thread"""
+        if self._thread is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the writer thread after flushing queued entries"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def record(self, entry: dict) -> bool:
+        """Queue an entry for writing; returns False if it was dropped"""
+        if self._thread is None:
+            return False
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            AUDIT_LOG_RECORDS.inc(result='dropped')
+            return False
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._drain()
+            if batch:
+                self._write(batch)
+
+    def _drain(self) -> List[dict]:
+        """Collect up to batch_size entries, waiting at most flush_interval for the first one"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[dict]):
+        lines = ''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in batch)
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            AUDIT_LOG_RECORDS.inc(len(batch), result='written')
+            if self.max_bytes > 0 and size >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            AUDIT_LOG_RECORDS.inc(len(batch), result='failed')
+            logger.error("Failed to write audit log batch to %s: %s", self.path, e)
+
+    def _rotate(self):
+        """Shift path -> path.1 -> path.2 ..., keeping backup_count old files"""
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
@@ -0,0 +1 @@
+"""Load-test and benchmark tooling for TDR Agent (not imported by the application)"""
@@ -0,0 +1,293 @@
+"""Replay a request audit log against a running TDR Agent at a target rate.
+
+Typical run against local stubs (no real TDR API or OpenRouter traffic):
+
+    python -m benchmarks.load_test --start-stubs --print-env
+    # start the agent with the printed environment, then:
+    python -m benchmarks.load_test --target http://127.0.0.1:5000 \\
+        --log logs/requests.jsonl --rps 20 --duration 60
+
+Each entry of the log (the format written by audit_log.AuditLogWriter) is turned
+back into the request that produced it. Latency percentiles, throughput and
+error rates are reported per route and saved under benchmarks/results/ so runs
+can be compared across versions with --compare.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Used when no log is given or the log is empty
+DEFAULT_ENTRIES = [
+    {'route': '/api/query', 'query': 'Show me the most risky users'},
+    {'route': '/api/query', 'query': 'List the top 5 risky devices'},
+    {'route': '/api/query', 'query': "Show me the organization's security summary"},
+    {'route': '/api/query', 'query': 'Describe risky user user123'},
+    {'route': '/api/proxy/<path:api_path>', 'endpoint': '/threats/users', 'query_params': {'limit': '10'}},
+    {'route': '/api/proxy/<path:api_path>', 'endpoint': '/threats/org/summary', 'query_params': {}},
+    {'route': '/api/ai-explain', 'endpoint': '/threats/users', 'prompt_chars': 2000},
+]
+
+
+def load_entries(path: Optional[str]) -> List[dict]:
+    """Read replayable entries from a JSON-lines request log"""
+    entries = []
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get('route') in ('/api/query', '/api/proxy/<path:api_path>', '/api/ai-explain', '/api/ask'):
+                    entries.append(entry)
+    return entries or list(DEFAULT_ENTRIES)
+
+
+def build_request(entry: dict) -> Tuple[str, str, dict]:
+    """Turn a log entry into (method, path, requests kwargs)"""
+    route = entry['route']
+    if route == '/api/query':
+        return 'POST', '/api/query', {'json': {'query': entry.get('query', '')}}
+    if route == '/api/ask':
+        return 'POST', '/api/ask', {'json': {'query': entry.get('query', ''), 'explain': entry.get('explain', True),
+                                             'stream': False}}
+    if route == '/api/proxy/<path:api_path>':
+        endpoint = entry.get('endpoint') or '/threats/org/summary'
+        return 'GET', f"/api/proxy{endpoint}", {'params': entry.get('query_params') or {}}
+    prompt = ('Explain this threat data. ' * (entry.get('prompt_chars', 500) // 26 + 1))[:entry.get('prompt_chars', 500)]
+    return 'POST', '/api/ai-explain', {'json': {
+        'prompt': prompt,
+        'apiRequest': {'method': 'GET', 'url': entry.get('endpoint') or '/threats/org/summary'},
+        'detected_language': entry.get('detected_language') or 'en'
+    }}
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadTest:
+    """Open-loop replay: requests are issued on a fixed schedule regardless of response times"""
+
+    def __init__(self, target: str, entries: List[dict], rps: float, duration: float,
+                 concurrency: int, timeout: float):
+        self.target = target.rstrip('/')
+        self.entries = entries
+        self.rps = rps
+        self.duration = duration
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._results: Dict[str, List[Tuple[float, bool]]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _send(self, entry: dict):
+        method, path, kwargs = build_request(entry)
+        start = time.perf_counter()
+        try:
+            response = self._session().request(method, self.target + path, timeout=self.timeout, **kwargs)
+            response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._results.setdefault(entry['route'], []).append((elapsed, ok))
+
+    def run(self) -> dict:
+        total = int(self.rps * self.duration)
+        interval = 1.0 / self.rps
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for index in range(total):
+                delay = started + index * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._send, self.entries[index % len(self.entries)])
+        wall = time.perf_counter() - started
+        return self._report(wall)
+
+    def _report(self, wall: float) -> dict:
+        routes = {}
+        all_latencies = []
+        all_errors = 0
+        for route, samples in sorted(self._results.items()):
+            latencies = sorted(elapsed for elapsed, _ in samples)
+            errors = sum(1 for _, ok in samples if not ok)
+            all_latencies.extend(latencies)
+            all_errors += errors
+            routes[route] = _summarize(latencies, errors, wall)
+        return {
+            'routes': routes,
+            'overall': _summarize(sorted(all_latencies), all_errors, wall),
+            'wall_seconds': round(wall, 3)
+        }
+
+
+def _ms(value: Optional[float]) -> Optional[float]:
+    return round(value * 1000, 2) if value is not None else None
+
+
+def _summarize(latencies: List[float], errors: int, wall: float) -> dict:
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        'throughput_rps': round(count / wall, 2) if wall else 0.0,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+    }
+
+
+def _version() -> Tuple[str, Optional[str]]:
+    try:
+        with open(os.path.join(PROJECT_ROOT, 'VERSION'), 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except OSError:
+        version = 'unknown'
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return version, commit
+
+
+def save_results(report: dict, args: argparse.Namespace) -> str:
+    """Write the report plus run metadata to the output directory (benchmarks/results/ by default)"""
+    os.makedirs(args.output_dir, exist_ok=True)
+    version, commit = _version()
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(args.output_dir, f"load-{version}-{commit or 'nogit'}-{stamp}.json")
+    payload = {
+        'version': version,
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'params': {'target': args.target, 'log': args.log, 'rps': args.rps, 'duration': args.duration,
+                   'concurrency': args.concurrency},
+        **report
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2)
+    return path
+
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    header = f"{'route':<32}{'reqs':>7}{'err%':>7}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print('-' * len(header))
+    rows = list(report['routes'].items()) + [('overall', report['overall'])]
+    for route, stats in rows:
+        print(f"{route:<32}{stats['requests']:>7}{stats['error_rate'] * 100:>6.1f}%{stats['throughput_rps']:>8}"
+              f"{_fmt(stats['p50_ms']):>10}{_fmt(stats['p95_ms']):>10}{_fmt(stats['p99_ms']):>10}")
+        if baseline:
+            base = baseline['overall'] if route == 'overall' else baseline.get('routes', {}).get(route)
+            if base:
+                print(f"{'  vs baseline':<32}{'':>7}{'':>7}{'':>8}"
+                      f"{_delta(stats['p50_ms'], base.get('p50_ms')):>10}"
+                      f"{_delta(stats['p95_ms'], base.get('p95_ms')):>10}"
+                      f"{_delta(stats['p99_ms'], base.get('p99_ms')):>10}")
+
+
+def _fmt(value) -> str:
+    return '-' if value is None else f"{value:.1f}"
+
+
+def _delta(current, base) -> str:
+    if current is None or not base:
+        return '-'
+    return f"{(current - base) / base * 100:+.0f}%"
+
+
+def start_stubs(tdr_port: int, llm_port: int, llm_latency: float, tokens_per_second: float):
+    """Run both stub backends in background threads of this process"""
+    from werkzeug.serving import make_server
+    from benchmarks.stub_llm import create_app as create_llm_app
+    from benchmarks.stub_tdr_api import create_app as create_tdr_app
+
+    servers = [
+        make_server('127.0.0.1', tdr_port, create_tdr_app(), threaded=True),
+        make_server('127.0.0.1', llm_port, create_llm_app(llm_latency, tokens_per_second), threaded=True),
+    ]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return servers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a request log against TDR Agent')
+    parser.add_argument('--target', default='http://127.0.0.1:5000', help='Base URL of the running agent')
+    parser.add_argument('--log', help='Request log to replay (default: built-in query mix)')
+    parser.add_argument('--rps', type=float, default=10.0, help='Target request rate')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds')
+    parser.add_argument('--concurrency', type=int, default=64, help='Maximum in-flight requests')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-request timeout in seconds')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--no-save', action='store_true', help='Do not write a results file')
+    parser.add_argument('--output-dir', default=RESULTS_DIR, help='Directory the results file is written to')
+    parser.add_argument('--start-stubs', action='store_true', help='Start stub TDR API and LLM in this process')
+    parser.add_argument('--tdr-port', type=int, default=8001)
+    parser.add_argument('--llm-port', type=int, default=8002)
+    parser.add_argument('--llm-latency', type=float, default=0.3)
+    parser.add_argument('--llm-tokens-per-second', type=float, default=100.0)
+    parser.add_argument('--print-env', action='store_true', help='Print the agent environment for the stubs and wait')
+    args = parser.parse_args()
+
+    if args.start_stubs:
+        start_stubs(args.tdr_port, args.llm_port, args.llm_latency, args.llm_tokens_per_second)
+        print(f"Stub TDR API on http://127.0.0.1:{args.tdr_port}, stub LLM on http://127.0.0.1:{args.llm_port}/v1")
+    if args.print_env:
+        print("Start the agent with (no tdr_config.json present, or it will override these):")
+        print(f"  TDR_HOSTNAME=http://127.0.0.1:{args.tdr_port} OPENAI_API_KEY=stub "
+              f"OPENAI_BASE_URL=http://127.0.0.1:{args.llm_port}/v1 python app.py")
+        if args.start_stubs:
+            print("Press Ctrl+C to stop the stubs.")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    entries = load_entries(args.log)
+    print(f"Replaying {len(entries)} distinct requests at {args.rps} rps for {args.duration}s against {args.target}")
+    report = LoadTest(args.target, entries, args.rps, args.duration, args.concurrency, args.timeout).run()
+    print_report(report, baseline)
+    if not args.no_save:
+        print(f"\nResults saved to {save_results(report, args)}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
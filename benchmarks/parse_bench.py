@@ -0,0 +1,237 @@
+"""Microbenchmarks for the in-process parsing hot path of /api/query.
+
+Measures per-call latency, throughput and memory for detect_language,
+NaturalLanguageProcessor._extract_intent, the _extract_* slot extractors,
+_build_api_request and process_query end to end, over a generated multilingual
+query corpus. Every function's outputs are digested and compared with the saved
+baseline, so an optimization that changes results fails the run.
+
+    python -m benchmarks.parse_bench                    # run and compare with the baseline
+    python -m benchmarks.parse_bench --save-baseline    # record a new baseline
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'parse_baseline.json')
+
+LIMIT_FORMS = ['', 'top {n} ', 'first {n} ', '{n} most ']
+DATE_FORMS = ['', ' on {date}', ' for {date}', ' from yesterday', ' yesterday']
+
+ENGLISH_TEMPLATES = {
+    'users': ['Show me the {limit}risky users{date}', 'List the {limit}anomalous users{date}',
+              'Which users are risky{date}?'],
+    'user_summary': ['Describe risky user {id}{date}', 'Give me details for user {id}',
+                     'summary of user id {id}{date}'],
+    'devices': ['Show me the {limit}risky devices{date}', 'Which devices are anomalous{date}?',
+                'List the {limit}devices with security threats{date}'],
+    'device_summary': ['Describe risky device {id}{date}', 'Provide a summary of device {id}',
+                       'details for device id {id}{date}'],
+    'rare_processes': ['List the {limit}rare process executions{date}', 'Show me the rare processes{date}',
+                       'Which executions were unusual{date}?'],
+    'rare_process_summary': ['Describe rare process execution alert {num}', 'details of process alert id {num}',
+                             'summary of process id {num}'],
+    'org': ["Show me the organization's security summary{date}", 'What is the overall security risk{date}?',
+            'Describe the company posture{date}'],
+    'unmatched': ['I am worried about insider threats', 'What happened during the incident?',
+                  'Anything suspicious going on?'],
+}
+
+LOCALIZED_TEMPLATES = {
+    'zh': ['显示风险最高的用户', '列出前{n}个有风险的设备', '组织的安全摘要是什么', '描述用户 user{num} 的详细信息',
+           '昨天有哪些罕见进程', '显示 top {n} risky users'],
+    'zh-tw': ['顯示風險最高的使用者', '列出前{n}個有風險的裝置', '組織的安全摘要是什麼', '請解釋異常的執行程序'],
+    'ja': ['最もリスクの高いユーザーを表示してください', '上位{n}台の危険なデバイスを一覧表示', '組織のセキュリティ概要を教えて'],
+    'ko': ['가장 위험한 사용자를 보여주세요', '상위 {n}개의 위험한 장치 목록', '조직의 보안 요약을 알려주세요'],
+    'ar': ['أظهر المستخدمين الأكثر خطورة', 'اعرض أخطر {n} أجهزة', 'ما هو ملخص أمان المؤسسة'],
+    'ru': ['Покажи самых рискованных пользователей', 'Список {n} опасных устройств', 'Сводка безопасности организации'],
+}
+
+ID_STYLES = ['{num}', 'user{num}', 'u{num}', 'jdoe{num}', 'host{num}', 'ws{num}x']
+
+
+def generate_corpus(size: int, seed: int = 1234) -> List[str]:
+    """Deterministically generate a mixed-language corpus covering every intent, ID style and date form"""
+    rng = random.Random(seed)
+    english = [(intent, template) for intent, templates in ENGLISH_TEMPLATES.items() for template in templates]
+    localized = [template for templates in LOCALIZED_TEMPLATES.values() for template in templates]
+    corpus = []
+    for index in range(size):
+        num = rng.randint(1, 99_999_999)
+        fields = {
+            'n': rng.randint(1, 150),
+            'num': num,
+            'id': rng.choice(ID_STYLES).format(num=num),
+            'date': (date(2024, 1, 1) + timedelta(days=rng.randint(0, 700))).isoformat(),
+        }
+        if index % 5 == 4:
+            template = rng.choice(localized)
+        else:
+            _, template = rng.choice(english)
+            fields['limit'] = rng.choice(LIMIT_FORMS).format(**fields)
+            fields['date'] = rng.choice(DATE_FORMS).format(**fields)
+        text = template.format(**fields)
+        if rng.random() < 0.1:
+            text = text.upper()
+        corpus.append(text)
+    return corpus
+
+
+def _import_app():
+    """Import app.py with side effects (audit log, threat store, verbose logging, AI fallback) disabled"""
+    os.environ.setdefault('TDR_AUDIT_LOG_ENABLED', 'false')
+    os.environ.setdefault('TDR_THREAT_STORE_ENABLED', 'false')
+    os.environ.setdefault('TDR_LOG_LEVEL', 'ERROR')
+    os.chdir(PROJECT_ROOT)
+    if PROJECT_ROOT not in sys.path:
+        sys.path.insert(0, PROJECT_ROOT)
+    import app
+    # Keep process_query offline (with no key the AI fallback returns immediately) and make the
+    # built requests independent of any local tdr_config.json
+    app.Config.update_config('localhost:8000', '', openai_api_key='')
+    return app
+
+
+def _normalize(value) -> str:
+    """Stable text form of an output; relative dates are replaced so digests don't change daily"""
+    text = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return text.replace((date.today() - timedelta(days=1)).isoformat(), '<yesterday>')
+
+
+def build_cases(app, corpus: List[str]) -> Dict[str, Tuple[Callable, List[tuple]]]:
+    """Map benchmark name -> (function, argument tuples)"""
+    nlp = app.nlp
+    lowered = [query.lower().strip() for query in corpus]
+    intents = [nlp._extract_intent(query) for query in lowered]
+    build_args = [(nlp.endpoints[key], params) for key, params in (i for i in intents if i)]
+    return {
+        'detect_language': (app.detect_language, [(query,) for query in corpus]),
+        '_extract_intent': (nlp._extract_intent, [(query,) for query in lowered]),
+        '_extract_user_id': (nlp._extract_user_id, [(query,) for query in lowered]),
+        '_extract_device_id': (nlp._extract_device_id, [(query,) for query in lowered]),
+        '_extract_alert_id': (nlp._extract_alert_id, [(query,) for query in lowered]),
+        '_extract_limit': (nlp._extract_limit, [(query,) for query in lowered]),
+        '_extract_date': (nlp._extract_date, [(query,) for query in lowered]),
+        '_build_api_request': (nlp._build_api_request, build_args),
+        'process_query': (nlp.process_query, [(query,) for query in corpus]),
+    }
+
+
+def digest(func: Callable, args_list: List[tuple]) -> str:
+    """SHA-256 over the normalized outputs of func for every argument tuple"""
+    h = hashlib.sha256()
+    for args in args_list:
+        h.update(_normalize(func(*args)).encode('utf-8'))
+        h.update(b'\n')
+    return h.hexdigest()
+
+
+def time_calls(func: Callable, args_list: List[tuple], repeat: int) -> float:
+    """Best-of-repeat seconds for one pass over args_list"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in args_list:
+            func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure_memory(func: Callable, args_list: List[tuple]) -> Tuple[int, int]:
+    """Peak and retained traced bytes for one pass over args_list"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        for args in args_list:
+            func(*args)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before, current - before
+
+
+def run(size: int, repeat: int, seed: int) -> dict:
+    app = _import_app()
+    corpus = generate_corpus(size, seed)
+    results = {}
+    for name, (func, args_list) in build_cases(app, corpus).items():
+        if not args_list:
+            continue
+        func(*args_list[0])  # Warm up regex caches
+        seconds = time_calls(func, args_list, repeat)
+        peak, retained = measure_memory(func, args_list)
+        results[name] = {
+            'calls': len(args_list),
+            'ns_per_call': round(seconds / len(args_list) * 1e9, 1),
+            'calls_per_sec': round(len(args_list) / seconds, 1),
+            'peak_bytes': peak,
+            'retained_bytes': retained,
+            'output_digest': digest(func, args_list),
+        }
+    return {'corpus_size': size, 'seed': seed, 'repeat': repeat, 'results': results}
+
+
+def compare(report: dict, baseline: dict) -> bool:
+    """Print timings next to the baseline; returns False if any output digest changed"""
+    ok = True
+    header = f"{'function':<22}{'calls':>7}{'ns/call':>12}{'calls/s':>13}{'peak KiB':>10}{'vs base':>9}  output"
+    print(header)
+    print('-' * len(header))
+    same_corpus = baseline and baseline.get('corpus_size') == report['corpus_size'] and baseline.get('seed') == report['seed']
+    for name, stats in report['results'].items():
+        base = (baseline or {}).get('results', {}).get(name) if same_corpus else None
+        change = f"{(stats['ns_per_call'] - base['ns_per_call']) / base['ns_per_call'] * 100:+.0f}%" if base else '-'
+        if base is None:
+            status = 'no baseline'
+        elif base['output_digest'] == stats['output_digest']:
+            status = 'ok'
+        else:
+            status = 'CHANGED'
+            ok = False
+        print(f"{name:<22}{stats['calls']:>7}{stats['ns_per_call']:>12.1f}{stats['calls_per_sec']:>13.1f}"
+              f"{stats['peak_bytes'] / 1024:>10.1f}{change:>9}  {status}")
+    if baseline and not same_corpus:
+        print("\nBaseline was recorded with a different corpus size or seed; outputs and timings not compared.")
+    return ok
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks for the query parsing hot path')
+    parser.add_argument('--size', type=int, default=5000, help='Corpus size')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions (best is reported)')
+    parser.add_argument('--seed', type=int, default=1234, help='Corpus generator seed')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline file to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true', help='Save this run as the new baseline')
+    args = parser.parse_args()
+
+    report = run(args.size, args.repeat, args.seed)
+    ok = compare(report, load_baseline(args.baseline))
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if not ok:
+        print("\nOutput digests differ from the baseline: parsing results changed.")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
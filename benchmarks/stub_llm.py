@@ -0,0 +1,118 @@
+"""Local stub of an OpenAI-compatible chat completions endpoint.
+
+Usage:
+    python -m benchmarks.stub_llm --port 8002 --latency 0.4 --tokens-per-second 80
+
+Then point the agent at it with OPENAI_BASE_URL=http://127.0.0.1:8002/v1 and any
+non-empty OPENAI_API_KEY.
+"""
+import argparse
+import json
+import re
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request
+
+FILLER_WORDS = ('The', 'analysis', 'shows', 'elevated', 'risk', 'for', 'several', 'entities', 'with',
+                'unusual', 'login', 'activity', 'and', 'rare', 'process', 'executions', 'that', 'warrant',
+                'investigation', 'by', 'the', 'security', 'team.')
+
+# The parser prompts embed the user query as `Query: "..."` (or its zh/zh-tw equivalent)
+QUERY_PATTERN = re.compile(r'(?:Query|查询|查詢): "(.*?)"', re.S)
+
+
+def _parse_response(messages) -> str:
+    """Answer a query-parsing prompt with a valid endpoint selection"""
+    prompt = ' '.join(m.get('content', '') for m in messages)
+    match = QUERY_PATTERN.search(prompt)
+    query = match.group(1).lower() if match else ''
+    if 'device' in query:
+        endpoint = 'GET /threats/devices/'
+    elif 'process' in query:
+        endpoint = 'GET /threats/rare-processes/'
+    else:
+        endpoint = 'GET /threats/org/summary/'
+    return json.dumps({'endpoint': endpoint, 'parameters': {}, 'confidence': 0.7})
+
+
+def _explanation_tokens(count: int):
+    for index in range(count):
+        yield FILLER_WORDS[index % len(FILLER_WORDS)] + ' '
+
+
+def create_app(latency: float = 0.3, tokens_per_second: float = 100.0, completion_tokens: int = 200) -> Flask:
+    """Build the stub LLM application"""
+    app = Flask(__name__)
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    @app.route('/chat/completions', methods=['POST'])
+    def chat_completions():
+        body = request.get_json(force=True)
+        messages = body.get('messages', [])
+        model = body.get('model', 'stub-model')
+        prompt_tokens = sum(len(m.get('content', '').split()) for m in messages)
+        is_parse = any('parser' in m.get('content', '').lower() for m in messages if m.get('role') == 'system')
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        token_delay = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+        if is_parse:
+            tokens = [_parse_response(messages)]
+        else:
+            tokens = list(_explanation_tokens(completion_tokens))
+
+        if body.get('stream'):
+            def generate():
+                time.sleep(latency)
+                for token in tokens:
+                    chunk = {
+                        'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                        'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    time.sleep(token_delay)
+                final = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            return Response(generate(), mimetype='text/event-stream')
+
+        time.sleep(latency + token_delay * len(tokens))
+        return jsonify({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': ''.join(tokens).strip()},
+                'finish_reason': 'stop'
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': len(tokens),
+                'total_tokens': prompt_tokens + len(tokens)
+            }
+        })
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub OpenAI-compatible chat completions endpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8002)
+    parser.add_argument('--latency', type=float, default=0.3, help='Time to first token in seconds')
+    parser.add_argument('--tokens-per-second', type=float, default=100.0, help='Generation rate')
+    parser.add_argument('--completion-tokens', type=int, default=200, help='Tokens per explanation')
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.tokens_per_second, args.completion_tokens)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Local stub of the TDR API serving deterministic synthetic threat data.
+
+Usage:
+    python -m benchmarks.stub_tdr_api --port 8001 --latency 0.05
+
+Then point the agent at it with TDR_HOSTNAME=http://127.0.0.1:8001.
+"""
+import argparse
+import hashlib
+import random
+import time
+from datetime import date, timedelta
+
+from flask import Flask, jsonify, request
+
+EXECUTABLES = ['powershell.exe', 'rundll32.exe', 'certutil.exe', 'mshta.exe', 'wmic.exe',
+               'regsvr32.exe', 'bitsadmin.exe', 'cmd.exe', 'python.exe', 'psexec.exe']
+
+
+def _rng(*parts) -> random.Random:
+    """Deterministic RNG seeded from the request identity, so repeated calls return identical data"""
+    seed = hashlib.sha256('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+
+def _request_date() -> str:
+    return request.args.get('date[eq]') or (date.today() - timedelta(days=1)).isoformat()
+
+
+def _limit(default: int = 10) -> int:
+    try:
+        return max(1, min(int(request.args.get('limit', default)), 100))
+    except ValueError:
+        return default
+
+
+def create_app(latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+               entities: int = 500) -> Flask:
+    """Build the stub TDR API application"""
+    app = Flask(__name__)
+
+    @app.before_request
+    def simulate_latency():
+        if latency or jitter:
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        if error_rate and random.random() < error_rate:
+            return jsonify({'detail': 'Synthetic upstream error'}), 503
+
+    def ranked(kind: str, day: str, limit: int):
+        rng = _rng(kind, day)
+        ids = rng.sample(range(entities), min(limit, entities))
+        rows = [(f"{kind}{i:04d}", rng.randint(1, 100)) for i in ids]
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    @app.route('/threats/users', strict_slashes=False)
+    def users():
+        day = _request_date()
+        rows = ranked('user', day, _limit())
+        return jsonify({
+            'data': [{'user': f"{name}@example.com", 'date': day, 'risk': risk} for name, risk in rows],
+            'summary': f"{len(rows)} risky users on {day}; highest risk {rows[0][1] if rows else 0}."
+        })
+
+    @app.route('/threats/users/<user_id>/summary', strict_slashes=False)
+    def user_summary(user_id):
+        day = _request_date()
+        rng = _rng('user-summary', user_id, day)
+        return jsonify({
+            'user': user_id,
+            'date': day,
+            'summary': f"User {user_id} logged in from {rng.randint(2, 9)} new locations and accessed "
+                       f"{rng.randint(10, 400)} sensitive files on {day}."
+        })
+
+    @app.route('/threats/devices', strict_slashes=False)
+    def devices():
+        day = _request_date()
+        rows = ranked('device', day, _limit())
+        return jsonify({
+            'data': [{'device': f"{name}.corp.example.com", 'date': day, 'risk': risk} for name, risk in rows],
+            'summary': f"{len(rows)} risky devices on {day}."
+        })
+
+    @app.route('/threats/devices/<device_id>/summary', strict_slashes=False)
+    def device_summary(device_id):
+        day = _request_date()
+        rng = _rng('device-summary', device_id, day)
+        return jsonify({
+            'device': device_id,
+            'date': day,
+            'summary': f"Device {device_id} made {rng.randint(50, 5000)} outbound connections to "
+                       f"{rng.randint(1, 30)} rare domains on {day}."
+        })
+
+    @app.route('/threats/rare-processes', strict_slashes=False)
+    def rare_processes():
+        day = _request_date()
+        rng = _rng('rare-processes', day)
+        rows = []
+        for index in range(_limit()):
+            start = f"{day}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00Z"
+            rows.append({
+                'id': rng.randint(10_000_000, 99_999_999),
+                'entity': f"user{rng.randint(0, entities - 1):04d}@example.com",
+                'executable': rng.choice(EXECUTABLES),
+                'started_at': start,
+                'ended_at': start,
+                'risk': rng.randint(1, 100)
+            })
+        rows.sort(key=lambda row: row['risk'], reverse=True)
+        return jsonify({'data': rows, 'summary': f"{len(rows)} rare process executions on {day}."})
+
+    @app.route('/threats/rare-processes/<alert_id>/summary', strict_slashes=False)
+    def rare_process_summary(alert_id):
+        rng = _rng('rare-process-summary', alert_id)
+        day = (date.today() - timedelta(days=rng.randint(0, 30))).isoformat()
+        executable = rng.choice(EXECUTABLES)
+        return jsonify({
+            'entity': f"user{rng.randint(0, entities - 1):04d}@example.com",
+            'executable': executable,
+            'started_at': f"{day}T10:00:00Z",
+            'ended_at': f"{day}T10:05:00Z",
+            'risk': rng.randint(1, 100),
+            'summary': f"{executable} was executed for the first time in the organization."
+        })
+
+    @app.route('/threats/org/summary', strict_slashes=False)
+    def org_summary():
+        day = _request_date()
+        rng = _rng('org-summary', day)
+        return jsonify({
+            'date': day,
+            'summary': f"Organization risk score {rng.randint(10, 90)}/100 on {day}: "
+                       f"{rng.randint(0, 20)} high-risk users, {rng.randint(0, 15)} high-risk devices and "
+                       f"{rng.randint(0, 40)} rare process executions."
+        })
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stub TDR API with synthetic threat data')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='Added response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform +/- jitter on the latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--entities', type=int, default=500, help='Size of the synthetic user/device population')
+    args = parser.parse_args()
+
+    app = create_app(args.latency, args.jitter, args.error_rate, args.entities)
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
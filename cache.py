@@ -0,0 +1,105 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from metrics import CACHE_REQUESTS
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe, size-bounded cache whose entries expire after a time-to-live.
+
+    Entries are kept in insertion order, and a heap of expiry times tracks
+    which entry expires next, since entries may be given their own TTL;
+    expired entries are purged on every write. When the cache is full the
+    oldest entry is evicted. If
+    `on_evict` is given it is called with (key, value) for every entry that
+    expires or is evicted without having been popped. Lookups are counted in
+    `tdr_cache_requests_total{cache=<name>}`.
+    """
+
+    def __init__(self, name: str, max_entries: int = 256, ttl: float = 60.0,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # (expires_at, sequence, key); entries that were replaced or removed since are skipped when popped
+        self._expiry: list = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        value = self._lookup(key, remove=False)
+        return default if value is _MISSING else value
+
+    def pop(self, key: Hashable, default=None):
+        """Remove and return the cached value for key, or default if missing or expired"""
+        value = self._lookup(key, remove=True)
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value, ttl: Optional[float] = None):
+        """Store value under key for ttl seconds (defaults to the cache TTL)"""
+        evicted = []
+        now = time.monotonic()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires_at, value)
+            heapq.heappush(self._expiry, (expires_at, next(self._sequence), key))
+            while self._expiry and self._expiry[0][0] <= now:
+                expired_at, _, expired_key = heapq.heappop(self._expiry)
+                entry = self._entries.get(expired_key)
+                if entry is not None and entry[0] == expired_at:
+                    del self._entries[expired_key]
+                    evicted.append((expired_key, entry[1]))
+            while len(self._entries) > self.max_entries:
+                oldest_key, (_, oldest_value) = self._entries.popitem(last=False)
+                evicted.append((oldest_key, oldest_value))
+            if len(self._expiry) > 2 * len(self._entries) + 16:
+                # Drop the heap items of replaced and removed entries
+                self._expiry = [(expires, next(self._sequence), k) for k, (expires, _) in self._entries.items()]
+                heapq.heapify(self._expiry)
+        self._notify(evicted)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            evicted = [(key, value) for key, (_, value) in self._entries.items()]
+            self._entries.clear()
+            self._expiry.clear()
+        self._notify(evicted)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _lookup(self, key: Hashable, remove: bool):
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                evicted.append((key, entry[1]))
+                entry = None
+            elif entry is not None and remove:
+                del self._entries[key]
+        self._notify(evicted)
+        CACHE_REQUESTS.inc(cache=self.name, result='hit' if entry is not None else 'miss')
+        return entry[1] if entry is not None else _MISSING
+
+    def _notify(self, evicted):
+        if self.on_evict:
+            for key, value in evicted:
+                self.on_evict(key, value)
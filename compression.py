@@ -0,0 +1,80 @@
+import gzip
+import hashlib
+from typing import Dict, Optional
+
+from flask import Request, Response
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered without it
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml',
+    'image/svg+xml', 'text/html', 'text/css', 'text/plain', 'text/javascript',
+}
+
+# Upstream headers that describe the relayed body itself. Everything else describes the upstream
+# connection, encoding or server (Content-Encoding, Content-Length, Transfer-Encoding, Date, Server, ...):
+# requests has already decoded the body, Flask sets its own Date and Server, and a cached entry would
+# replay a stale Date.
+RELAYED_HEADERS = {'content-type', 'content-language', 'cache-control', 'last-modified'}
+
+
+def passthrough_headers(headers) -> Dict[str, str]:
+    """Upstream response headers that can be relayed with the decoded body"""
+    return {name: value for name, value in headers.items() if name.lower() in RELAYED_HEADERS}
+
+
+def choose_encoding(request: Request) -> Optional[str]:
+    """Preferred supported content coding from Accept-Encoding, or None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] and accepted['br'] >= accepted['gzip']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response: Response, request: Request, min_size: int = 500, gzip_level: int = 6,
+                      brotli_quality: int = 5) -> Response:
+    """Compress a buffered, compressible response body in place if the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request)
+    body = response.get_data()
+    if encoding is None or len(body) < min_size:
+        return response
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=brotli_quality)
+    else:
+        compressed = gzip.compress(body, compresslevel=gzip_level)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def apply_etag(response: Response, request: Request) -> Response:
+    """Tag a buffered 200 GET/HEAD response with a content-hash ETag and answer a matching If-None-Match with 304.
+
+    The tag is weak because the same content is served with different content
+    codings. Other methods are left alone: a conditional POST could only be
+    answered with 412, never 304 (RFC 9110, section 13.1.2).
+    """
+    if (request.method not in ('GET', 'HEAD') or response.status_code != 200 or response.direct_passthrough
+            or response.is_streamed):
+        return response
+    etag = hashlib.sha256(response.get_data()).hexdigest()[:32]
+    response.set_etag(etag, weak=True)
+    if 'Cache-Control' not in response.headers:
+        # Let browsers keep the body but revalidate it on every use
+        response.cache_control.no_cache = True
+    if request.if_none_match.contains_weak(etag):
+        response.status_code = 304
+        response.set_data(b'')
+        response.headers.pop('Content-Length', None)
+        response.headers.pop('Content-Type', None)
+    return response
@@ -20,6 +20,86 @@ class Config:
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', DEFAULT_OPENAI_MODEL)
     OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', DEFAULT_OPENAI_BASE_URL)
     
+    # Logging configuration
+    LOG_LEVEL = os.getenv('TDR_LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('TDR_LOG_FORMAT', 'text')  # "text" or "json"
+    LOG_DEBUG = os.getenv('TDR_LOG_DEBUG', '').lower() in ('1', 'true', 'yes')  # Log everything, unsampled and untruncated
+    LOG_MAX_PAYLOAD_CHARS = int(os.getenv('TDR_LOG_MAX_PAYLOAD_CHARS', '500'))
+    LOG_SAMPLE_RATE = float(os.getenv('TDR_LOG_SAMPLE_RATE', '1.0'))  # Default INFO sample rate per request
+    LOG_ROUTE_SAMPLE_RATES = os.getenv('TDR_LOG_ROUTE_SAMPLE_RATES', '')  # e.g. "/api/query=0.1,/api/proxy/<path:api_path>=0.05"
+    
+    # Request audit log (one JSON line per handled /api/query, /api/proxy and /api/ai-explain request)
+    AUDIT_LOG_ENABLED = os.getenv('TDR_AUDIT_LOG_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    AUDIT_LOG_FILE = os.getenv('TDR_AUDIT_LOG_FILE', os.path.join('logs', 'requests.jsonl'))
+    AUDIT_LOG_MAX_BYTES = int(os.getenv('TDR_AUDIT_LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+    AUDIT_LOG_BACKUP_COUNT = int(os.getenv('TDR_AUDIT_LOG_BACKUP_COUNT', '3'))
+    AUDIT_LOG_QUEUE_SIZE = int(os.getenv('TDR_AUDIT_LOG_QUEUE_SIZE', '10000'))
+    AUDIT_LOG_BATCH_SIZE = int(os.getenv('TDR_AUDIT_LOG_BATCH_SIZE', '500'))
+    AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv('TDR_AUDIT_LOG_FLUSH_INTERVAL', '1.0'))
+    
+    # Maximum concurrent upstream fetches started in the background (e.g. by /api/ask)
+    UPSTREAM_WORKERS = int(os.getenv('TDR_UPSTREAM_WORKERS', '16'))
+    
+    # Speculative prefetch: /api/query starts the upstream GET for rule-based matches so the
+    # following /api/proxy call can be answered from a short-lived cache
+    SPECULATIVE_PREFETCH = os.getenv('TDR_SPECULATIVE_PREFETCH', '').lower() in ('1', 'true', 'yes')
+    SPECULATIVE_PREFETCH_TTL = float(os.getenv('TDR_SPECULATIVE_PREFETCH_TTL', '30'))
+    SPECULATIVE_PREFETCH_MAX_ENTRIES = int(os.getenv('TDR_SPECULATIVE_PREFETCH_MAX_ENTRIES', '256'))
+    
+    # Upstream response and explanation caches. A response cache TTL of 0 only serves pre-warmed entries.
+    RESPONSE_CACHE_TTL = float(os.getenv('TDR_RESPONSE_CACHE_TTL', '0'))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('TDR_RESPONSE_CACHE_MAX_ENTRIES', '1024'))
+    EXPLANATION_CACHE_TTL = float(os.getenv('TDR_EXPLANATION_CACHE_TTL', '21600'))
+    EXPLANATION_CACHE_MAX_ENTRIES = int(os.getenv('TDR_EXPLANATION_CACHE_MAX_ENTRIES', '512'))
+    
+    # Scheduled pre-warming of the standard daily views and their explanations
+    PREWARM_TIMES = os.getenv('TDR_PREWARM_TIMES', '')  # Local times, e.g. "06:30,12:00"; empty disables
+    PREWARM_LANGUAGES = os.getenv('TDR_PREWARM_LANGUAGES', 'en')  # e.g. "en,zh,ja"
+    PREWARM_LIMIT = int(os.getenv('TDR_PREWARM_LIMIT', '10'))  # Matches the default limit of list queries
+    PREWARM_TTL = float(os.getenv('TDR_PREWARM_TTL', '21600'))  # Closed (past) days
+    # Undated and today's views are still changing, so their pre-warmed responses are only kept briefly
+    PREWARM_OPEN_DAY_TTL = float(os.getenv('TDR_PREWARM_OPEN_DAY_TTL', '300'))
+    
+    # Server-side push of threat updates (/api/subscribe): one poller per watched view
+    SUBSCRIPTION_INTERVAL = float(os.getenv('TDR_SUBSCRIPTION_INTERVAL', '30'))
+    SUBSCRIPTION_HEARTBEAT = float(os.getenv('TDR_SUBSCRIPTION_HEARTBEAT', '15'))
+    SUBSCRIPTION_MAX_POLLERS = int(os.getenv('TDR_SUBSCRIPTION_MAX_POLLERS', '64'))
+    SUBSCRIPTION_QUEUE_SIZE = int(os.getenv('TDR_SUBSCRIPTION_QUEUE_SIZE', '100'))
+    
+    # "What changed" explanations (/api/ai-explain with mode=delta)
+    DELTA_SNAPSHOT_MAX_VIEWS = int(os.getenv('TDR_DELTA_SNAPSHOT_MAX_VIEWS', '256'))
+    DELTA_SNAPSHOT_TTL = float(os.getenv('TDR_DELTA_SNAPSHOT_TTL', '691200'))  # 8 days
+    DELTA_SUMMARY_CHARS = int(os.getenv('TDR_DELTA_SUMMARY_CHARS', '1500'))  # Prior explanation kept as context
+    
+    # Drill-down (/api/drilldown): per-entity summaries of a list explained in one LLM call
+    DRILLDOWN_DEFAULT_LIMIT = int(os.getenv('TDR_DRILLDOWN_DEFAULT_LIMIT', '10'))
+    DRILLDOWN_MAX_ENTITIES = int(os.getenv('TDR_DRILLDOWN_MAX_ENTITIES', '25'))
+    
+    # Local threat store (SQLite) for count, top-k and trend questions; opt-in
+    THREAT_STORE_ENABLED = os.getenv('TDR_THREAT_STORE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    THREAT_STORE_PATH = os.getenv('TDR_THREAT_STORE_PATH', 'data/threats.sqlite3')
+    THREAT_STORE_BACKFILL_DAYS = int(os.getenv('TDR_THREAT_STORE_BACKFILL_DAYS', '30'))
+    THREAT_STORE_RETENTION_DAYS = int(os.getenv('TDR_THREAT_STORE_RETENTION_DAYS', '90'))  # 0 keeps rows forever
+
+    # Directory caching the endpoint registry built from openapi.json, keyed by the spec hash (empty to disable)
+    ENDPOINT_CACHE_DIR = os.getenv('TDR_ENDPOINT_CACHE_DIR', 'data')
+    
+    # Response compression (gzip, or brotli when the brotli package is installed)
+    COMPRESSION_ENABLED = os.getenv('TDR_COMPRESSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    COMPRESSION_MIN_SIZE = int(os.getenv('TDR_COMPRESSION_MIN_SIZE', '500'))  # Bytes
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('TDR_COMPRESSION_GZIP_LEVEL', '6'))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('TDR_COMPRESSION_BROTLI_QUALITY', '5'))
+
+    # Web UI bundle: 'auto' serves the precompiled bundle (static/dist, built with frontend/build.mjs)
+    # when it exists, 'true' requires it, 'false' always serves the in-browser transpiled page
+    UI_BUNDLE = os.getenv('TDR_UI_BUNDLE', 'auto').lower()
+
+    # On-demand request profiling (cProfile plus timed spans), triggered by the X-TDR-Profile header or sampling
+    PROFILE_ENABLED = os.getenv('TDR_PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    PROFILE_SAMPLE_RATE = float(os.getenv('TDR_PROFILE_SAMPLE_RATE', '0'))  # Fraction of requests, 0.0-1.0
+    PROFILE_BUFFER_SIZE = int(os.getenv('TDR_PROFILE_BUFFER_SIZE', '50'))  # Most recent profiles kept
+    PROFILE_TOKEN = os.getenv('TDR_PROFILE_TOKEN', '')  # Required for any profiling, by the header and /api/profiles
+    
     # API Configuration
     API_BASE_URL = f"https://{HOSTNAME}" if not HOSTNAME.startswith(('http://', 'https://')) else HOSTNAME
     
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached registry layout changes, so stale cache files are rebuilt
+REGISTRY_FORMAT = 1
+
+HTTP_METHODS = {'get', 'put', 'post', 'delete', 'options', 'head', 'patch', 'trace'}
+
+
+class EndpointRegistry:
+    """The endpoints of the OpenAPI spec, shared by the rule-based and AI parsers.
+
+    `endpoints` maps "METHOD /path" keys to their path, method, summary,
+    description, parameters and operationId. `resolve` also accepts keys that
+    differ from the spec only in method case or trailing slash, or whose path
+    has its parameters filled in ("GET /threats/users/alice/summary"), by
+    walking a per-method trie of path segments: the cost depends on the depth
+    of the path, not on the number of endpoints. The endpoint list given to
+    the LLM for AI parsing is rendered once.
+    """
+
+    def __init__(self, endpoints: Dict[str, dict], spec_hash: str = ''):
+        self.endpoints = endpoints
+        self.spec_hash = spec_hash
+        self._routes: Dict[str, dict] = {}
+        for key, info in endpoints.items():
+            self._add_route(key, info)
+        self.prompt_context = self._render_prompt_context()
+
+    @classmethod
+    def from_spec(cls, spec: dict, spec_hash: str = '') -> 'EndpointRegistry':
+        endpoints = {}
+        for path, methods in spec.get('paths', {}).items():
+            for method, details in methods.items():
+                if method.lower() not in HTTP_METHODS:
+                    continue
+                endpoints[f"{method.upper()} {path}"] = {
+                    'path': path,
+                    'method': method.upper(),
+                    'summary': details.get('summary', ''),
+                    'description': details.get('description', ''),
+                    'parameters': details.get('parameters', []),
+                    'operationId': details.get('operationId', '')
+                }
+        return cls(endpoints, spec_hash)
+
+    @classmethod
+    def load(cls, spec_path: str, cache_dir: Optional[str] = None) -> 'EndpointRegistry':
+        """Registry for an OpenAPI spec file, reusing the one cached in cache_dir for the same spec contents.
+
+        On a cache hit the spec itself is hashed but not parsed. Lookups are counted in
+        `tdr_cache_requests_total{cache="endpoint_registry"}`.
+        """
+        with open(spec_path, 'rb') as f:
+            raw = f.read()
+        spec_hash = hashlib.sha256(raw).hexdigest()
+        cache_path = os.path.join(cache_dir, f'endpoints-{spec_hash[:16]}.json') if cache_dir else None
+        if cache_path:
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached.get('format') == REGISTRY_FORMAT and cached.get('spec_hash') == spec_hash:
+                    registry = cls(cached['endpoints'], spec_hash)
+                    CACHE_REQUESTS.inc(cache='endpoint_registry', result='hit')
+                    return registry
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError, AttributeError) as e:
+                logger.warning("Ignoring unreadable endpoint registry cache %s: %s", cache_path, e)
+            CACHE_REQUESTS.inc(cache='endpoint_registry', result='miss')
+
+        registry = cls.from_spec(json.loads(raw), spec_hash)
+        if cache_path:
+            registry.save(cache_path)
+        return registry
+
+    def save(self, path: str):
+        """Write the registry to path atomically; failures are logged, not raised"""
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'format': REGISTRY_FORMAT, 'spec_hash': self.spec_hash, 'endpoints': self.endpoints}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not cache the endpoint registry in %s: %s", path, e)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.endpoints.get(key)
+
+    def resolve(self, key: str) -> Optional[Tuple[str, Dict[str, str]]]:
+        """The spec key an endpoint key refers to and the path parameters filled into it, or None"""
+        if key in self.endpoints:
+            return key, {}
+        method, _, path = key.strip().partition(' ')
+        segments = [segment for segment in path.strip().split('?')[0].split('/') if segment]
+        params: Dict[str, str] = {}
+        found = self._match(self._routes.get(method.upper()), segments, params)
+        return (found, params) if found else None
+
+    def _add_route(self, key: str, info: dict):
+        node = self._routes.setdefault(info['method'], {})
+        for segment in (s for s in info['path'].split('/') if s):
+            if segment.startswith('{') and segment.endswith('}'):
+                name = segment[1:-1]
+                node = node.setdefault('{}', (name, {}))[1]
+            else:
+                node = node.setdefault(segment, {})
+        node.setdefault('', key)
+
+    def _match(self, node: Optional[dict], segments: List[str], params: Dict[str, str]) -> Optional[str]:
+        """Walk the trie; literal segments take precedence over parameters"""
+        if node is None:
+            return None
+        if not segments:
+            return node.get('')
+        segment, rest = segments[0], segments[1:]
+        found = self._match(node.get(segment), rest, params) if segment not in ('', '{}') else None
+        if found is None and '{}' in node:
+            name, child = node['{}']
+            # A template key such as "{user_id}" fills in nothing
+            is_template = segment == f'{{{name}}}'
+            found = self._match(child, rest, params)
+            if found is not None and not is_template:
+                params[name] = segment
+        return found
+
+    def _render_prompt_context(self) -> str:
+        """The endpoint list given to the LLM for AI parsing"""
+        lines = []
+        for endpoint_key, info in self.endpoints.items():
+            lines.append(f"- {endpoint_key}: {info['summary']}")
+            if info['description']:
+                lines.append(f"  Description: {info['description']}")
+            if info['parameters']:
+                params = [f"{p['name']} ({p.get('schema', {}).get('type', 'string')})" for p in info['parameters']]
+                lines.append(f"  Parameters: {', '.join(params)}")
+            lines.append("")
+        return '\n'.join(lines)
@@ -0,0 +1,363 @@
+import hashlib
+import json
+from typing import Iterator, List, Optional, Tuple
+
+from config import Config
+from lazy_import import lazy_import
+from metrics import UPSTREAM_LATENCY, UPSTREAM_RESPONSES, record_llm_usage
+
+# The OpenAI client library takes about a second to import; it is loaded when the first client is created
+openai = lazy_import('openai')
+
+# Optional OpenRouter attribution headers
+EXTRA_HEADERS = {
+    "HTTP-Referer": "https://github.com/yourusername/tdr-agent",  # Optional: Your app URL
+    "X-Title": "TDR Agent"  # Optional: Your app name
+}
+
+# System prompts for response explanations, per detected language
+SYSTEM_PROMPTS = {
+    'zh': "你是一名网络安全分析师，专门解释威胁检测和响应(TDR)数据。请提供清晰、专业的安全数据解释，帮助安全管理人员理解威胁并采取适当的行动。请用简体中文回答。",
+    'zh-tw': "您是一名網路安全分析師，專門解釋威脅偵測和回應(TDR)資料。請提供清晰、專業的安全資料解釋，幫助安全管理人員理解威脅並採取適當的行動。請用繁體中文回答。",
+    'ja': "あなたは脅威検出および対応（TDR）データを説明する専門のサイバーセキュリティアナリストです。セキュリティ管理者が脅威を理解し、適切な行動を取れるよう、明確で専門的なセキュリティデータの説明を提供してください。日本語で回答してください。",
+    'ko': "당신은 위협 탐지 및 대응(TDR) 데이터를 설명하는 전문 사이버보안 분석가입니다. 보안 관리자가 위협을 이해하고 적절한 조치를 취할 수 있도록 명확하고 전문적인 보안 데이터 설명을 제공해 주세요. 한국어로 답변해 주세요.",
+    'ar': "أنت محلل أمن سيبراني متخصص في شرح بيانات اكتشاف التهديدات والاستجابة (TDR). قدم شرحًا واضحًا ومهنيًا لبيانات الأمان لمساعدة مدراء الأمن على فهم التهديدات واتخاذ الإجراءات المناسبة. أجب باللغة العربية.",
+    'ru': "Вы эксперт-аналитик по кибербезопасности, специализирующийся на объяснении данных обнаружения и реагирования на угрозы (TDR). Предоставляйте четкие, профессиональные объяснения данных безопасности, чтобы помочь менеджерам по безопасности понять угрозы и принять соответствующие меры. Отвечайте на русском языке.",
+    'en': "You are a cybersecurity analyst expert in threat detection and response. Provide clear, professional explanations of security data that help security managers understand threats and take appropriate action."
+}
+
+# Explanation prompt templates, mirroring the ones templates/index.html builds in the browser
+_PROMPT_TEMPLATES = {
+    'zh': """你是一名网络安全分析师，正在解释威胁检测和响应(TDR)数据。
+
+API请求: {method} {url}
+查询参数: {query_params}
+
+API响应数据:
+{data}
+
+请提供清晰、自然语言的安全威胁数据解释。重点关注：
+
+1. **摘要**: 这些数据告诉我们什么安全威胁信息？
+2. **关键发现**: 最重要的安全洞察是什么？
+3. **风险评估**: 这些威胁的严重程度如何？
+4. **建议**: 应该采取什么行动？
+
+请以专业安全报告的形式回答。具体说明数字、日期和风险级别。使用清晰、非技术性语言，让安全管理人员能够理解。
+
+如果响应包含用户威胁数据，请解释：
+- 哪些用户面临最大风险
+- 什么行为触发了警报
+- 风险评分的含义
+
+如果响应包含设备威胁数据，请解释：
+- 哪些设备被入侵或可疑
+- 检测到什么活动
+- 网络安全影响
+
+如果响应包含进程数据，请解释：
+- 执行了什么异常进程
+- 为什么它们被认为是可疑的
+- 潜在的攻击向量
+
+保持解释简洁但全面。""",
+    'zh-tw': """您是一名網路安全分析師，正在解釋威脅偵測和回應(TDR)資料。
+
+API請求: {method} {url}
+查詢參數: {query_params}
+
+API回應資料:
+{data}
+
+請提供清晰、自然語言的安全威脅資料解釋。重點關注：
+
+1. **摘要**: 這些資料告訴我們什麼安全威脅資訊？
+2. **關鍵發現**: 最重要的安全洞察是什麼？
+3. **風險評估**: 這些威脅的嚴重程度如何？
+4. **建議**: 應該採取什麼行動？
+
+請以專業安全報告的形式回答。具體說明數字、日期和風險級別。使用清晰、非技術性語言，讓安全管理人員能夠理解。
+
+如果回應包含使用者威脅資料，請解釋：
+- 哪些使用者面臨最大風險
+- 什麼行為觸發了警報
+- 風險評分的含義
+
+如果回應包含裝置威脅資料，請解釋：
+- 哪些裝置被入侵或可疑
+- 偵測到什麼活動
+- 網路安全影響
+
+如果回應包含程序資料，請解釋：
+- 執行了什麼異常程序
+- 為什麼它們被認為是可疑的
+- 潛在的攻擊向量
+
+保持解釋簡潔但全面。""",
+    'ja': """あなたは脅威検出および対応（TDR）データを説明する専門のサイバーセキュリティアナリストです。
+
+APIリクエスト: {method} {url}
+クエリパラメータ: {query_params}
+
+APIレスポンスデータ:
+{data}
+
+この脅威検出データの明確で自然な言語での説明を提供してください。以下の点に焦点を当ててください：
+
+1. **要約**: このデータはどのようなセキュリティ脅威について教えてくれますか？
+2. **主要な発見**: 最も重要なセキュリティ洞察は何ですか？
+3. **リスク評価**: これらの脅威の深刻度はどの程度ですか？
+4. **推奨事項**: どのような行動を取るべきですか？
+
+専門的なセキュリティレポートの形式で回答してください。数字、日付、リスクレベルを具体的に説明し、セキュリティ管理者が理解できるよう、明確で非技術的な言語を使用してください。
+
+レスポンスにユーザー脅威データが含まれている場合、以下を説明してください：
+- どのユーザーが最もリスクにさらされているか
+- どの行動がアラートを引き起こしたか
+- リスクスコアの意味
+
+レスポンスにデバイス脅威データが含まれている場合、以下を説明してください：
+- どのデバイスが侵害されているか、または疑わしいか
+- どのような活動が検出されたか
+- ネットワークセキュリティへの影響
+
+レスポンスにプロセスデータが含まれている場合、以下を説明してください：
+- どのような異常なプロセスが実行されたか
+- なぜそれらが疑わしいと考えられるか
+- 潜在的な攻撃ベクトル
+
+説明は簡潔でありながら包括的であることを心がけてください。""",
+    'ko': """당신은 위협 탐지 및 대응(TDR) 데이터를 설명하는 전문 사이버보안 분석가입니다.
+
+API 요청: {method} {url}
+쿼리 매개변수: {query_params}
+
+API 응답 데이터:
+{data}
+
+이 위협 탐지 데이터에 대한 명확하고 자연스러운 언어 설명을 제공해 주세요. 다음에 중점을 두세요:
+
+1. **요약**: 이 데이터는 어떤 보안 위협에 대해 알려주나요?
+2. **주요 발견**: 가장 중요한 보안 인사이트는 무엇인가요?
+3. **위험 평가**: 이러한 위협의 심각도는 어느 정도인가요?
+4. **권장사항**: 어떤 조치를 취해야 하나요?
+
+전문적인 보안 보고서 형식으로 답변해 주세요. 숫자, 날짜, 위험 수준을 구체적으로 설명하고, 보안 관리자가 이해할 수 있도록 명확하고 비기술적인 언어를 사용해 주세요.
+
+응답에 사용자 위협 데이터가 포함된 경우 다음을 설명해 주세요:
+- 어떤 사용자가 가장 위험에 노출되어 있는지
+- 어떤 행동이 경고를 트리거했는지
+- 위험 점수의 의미
+
+응답에 디바이스 위협 데이터가 포함된 경우 다음을 설명해 주세요:
+- 어떤 디바이스가 손상되었거나 의심스러운지
+- 어떤 활동이 탐지되었는지
+- 네트워크 보안에 미치는 영향
+
+응답에 프로세스 데이터가 포함된 경우 다음을 설명해 주세요:
+- 어떤 비정상적인 프로세스가 실행되었는지
+- 왜 그것들이 의심스럽다고 여겨지는지
+- 잠재적인 공격 벡터
+
+설명은 간결하면서도 포괄적으로 작성해 주세요.""",
+    'en': """You are a cybersecurity analyst explaining threat detection and response (TDR) data.
+
+API Request: {method} {url}
+Query Parameters: {query_params}
+
+API Response Data:
+{data}
+
+Please provide a clear, natural language explanation of this threat detection data. Focus on:
+
+1. **Summary**: What does this data tell us about security threats?
+2. **Key Findings**: What are the most important security insights?
+3. **Risk Assessment**: How serious are these threats?
+4. **Recommendations**: What actions should be taken?
+
+Format your response as a professional security report. Be specific about numbers, dates, and risk levels. Use clear, non-technical language that a security manager could understand.
+
+If the response contains user threat data, explain:
+- Which users are most at risk
+- What behaviors triggered the alerts
+- Risk scores and their meaning
+
+If the response contains device threat data, explain:
+- Which devices are compromised or suspicious
+- What activities were detected
+- Network security implications
+
+If the response contains process data, explain:
+- What unusual processes were executed
+- Why they're considered suspicious
+- Potential attack vectors
+
+Keep the explanation concise but comprehensive."""
+}
+
+
+# "What changed" prompt for delta explanations. Server-side only, so not mirrored in index.html;
+# the language-specific system prompt sets the answer language.
+_DELTA_PROMPT_TEMPLATE = """You are a cybersecurity analyst reviewing what changed in threat detection and response (TDR) data since the previous review.
+
+API Request: {method} {url}
+Query Parameters: {query_params}
+
+Previous review ({since}):
+{prior_summary}
+
+Changes from {since} to {until}:
+{diff}
+
+The changes list entities that are new ("added"), no longer reported ("removed", by key) and re-scored ("changed", with the new entry and its "risk_delta"), plus changed top-level fields ("fields"). Explain what changed and what it means. Focus on:
+
+1. **What Changed**: A short overview of the changes since the previous review
+2. **Biggest Movers**: New high-risk entities and the largest risk increases
+3. **Improvements**: Entities that are no longer reported or whose risk decreased
+4. **Recommendations**: What should be looked at first
+
+If nothing changed, say so in one or two sentences. Do not repeat the previous review; only describe the changes."""
+
+# Batched prompt for drill-downs: several per-entity summaries explained in one call
+_DRILLDOWN_PROMPT_TEMPLATE = """You are a cybersecurity analyst explaining threat detection and response (TDR) data for several entities at once.
+
+API Request: {method} {url}
+Query Parameters: {query_params}
+
+The top {count} entities of this list, most risky first, with their risk score and detailed threat summary (one JSON object per line):
+{entities}
+
+Write one section per entity, in the same order, headed "### <entity>", covering:
+1. **Assessment**: What the summary shows and how serious it is
+2. **Recommended Action**: What to do next for this entity
+
+If an entry has an "error" instead of a summary, say that its details are unavailable. Finish with a short **Overall** section on patterns shared across the entities. Keep each section brief."""
+
+def create_client() -> 'openai.OpenAI':
+    """Create an OpenAI-compatible client for the configured OpenRouter endpoint"""
+    return openai.OpenAI(
+        api_key=Config.OPENAI_API_KEY,
+        base_url=Config.OPENAI_BASE_URL,
+        default_headers=EXTRA_HEADERS
+    )
+
+
+def get_system_prompt(detected_language: str) -> str:
+    """Get the explanation system prompt for a language, defaulting to English"""
+    return SYSTEM_PROMPTS.get(detected_language, SYSTEM_PROMPTS['en'])
+
+
+def build_explanation_prompt(response_data, api_request: dict, detected_language: str = 'en') -> str:
+    """Build the explanation prompt for an API response, as the web UI does"""
+    template = _PROMPT_TEMPLATES.get(detected_language, _PROMPT_TEMPLATES['en'])
+    return template.format(
+        method=api_request.get('method', 'GET'),
+        url=api_request.get('url', ''),
+        query_params=json.dumps(api_request.get('query_params') or {}, ensure_ascii=False, separators=(',', ':')),
+        data=json.dumps(response_data, indent=2, ensure_ascii=False) if not isinstance(response_data, str) else response_data
+    )
+
+
+def _compact_diff(diff: Optional[dict]) -> dict:
+    """Drop the old entry of re-scored entities whose risk delta already says what changed"""
+    if not diff:
+        return {}
+    compact = dict(diff)
+    if 'changed' in diff:
+        compact['changed'] = [
+            {k: v for k, v in change.items() if k != 'before'} if 'risk_delta' in change else change
+            for change in diff['changed']
+        ]
+    return compact
+
+
+def build_delta_prompt(diff: Optional[dict], prior_summary: str, api_request: dict, since: str, until: str) -> str:
+    """Build the "what changed" prompt from a snapshot diff and the previous explanation"""
+    return _DELTA_PROMPT_TEMPLATE.format(
+        method=api_request.get('method', 'GET'),
+        url=api_request.get('url', ''),
+        query_params=json.dumps(api_request.get('query_params') or {}, ensure_ascii=False, separators=(',', ':')),
+        since=since,
+        until=until,
+        prior_summary=prior_summary or '(none)',
+        diff=json.dumps(_compact_diff(diff), indent=1, ensure_ascii=False, default=str)
+    )
+
+
+def build_drilldown_prompt(entities: List[dict], api_request: dict) -> str:
+    """Build one prompt covering the per-entity summaries of a drill-down"""
+    return _DRILLDOWN_PROMPT_TEMPLATE.format(
+        method=api_request.get('method', 'GET'),
+        url=api_request.get('url', ''),
+        query_params=json.dumps(api_request.get('query_params') or {}, ensure_ascii=False, separators=(',', ':')),
+        count=len(entities),
+        entities='\n'.join(json.dumps(entity, ensure_ascii=False, separators=(',', ':'), default=str)
+                           for entity in entities)
+    )
+
+
+def explanation_cache_key(api_request: dict, response_data, detected_language: str = 'en',
+                          prompt: Optional[str] = None) -> Tuple:
+    """Cache key for an explanation: the model, language, request and a hash of the response data.
+
+    A client-supplied prompt replaces the standard one, so its hash is part of the key.
+    """
+    canonical = json.dumps(response_data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    params = tuple(sorted((k, str(v)) for k, v in (api_request.get('query_params') or {}).items() if v is not None))
+    key = (
+        Config.OPENAI_MODEL,
+        detected_language,
+        api_request.get('method', 'GET').upper(),
+        api_request.get('url', '').strip('/'),
+        params,
+        hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    )
+    if prompt:
+        key += ('prompt', hashlib.sha256(prompt.encode('utf-8')).hexdigest())
+    return key
+
+
+def generate_explanation(prompt: str, detected_language: str = 'en', client: Optional['openai.OpenAI'] = None,
+                         operation: str = 'explain') -> str:
+    """Generate a complete explanation from the LLM"""
+    client = client or create_client()
+    try:
+        with UPSTREAM_LATENCY.time(upstream='llm', operation=operation):
+            response = client.chat.completions.create(
+                model=Config.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": get_system_prompt(detected_language)},
+                    {"role": "user", "content": prompt}
+                ]
+            )
+    except Exception as e:
+        UPSTREAM_RESPONSES.inc(upstream='llm', status=getattr(e, 'status_code', None) or 'error')
+        raise
+    record_llm_usage(response, Config.OPENAI_MODEL, operation)
+    UPSTREAM_RESPONSES.inc(upstream='llm', status=200)
+    return response.choices[0].message.content
+
+
+def stream_explanation(prompt: str, detected_language: str = 'en', client: Optional['openai.OpenAI'] = None) -> Iterator[str]:
+    """Stream an explanation from the LLM, yielding text deltas as they arrive"""
+    client = client or create_client()
+    with UPSTREAM_LATENCY.time(upstream='llm', operation='explain_stream'):
+        try:
+            stream = client.chat.completions.create(
+                model=Config.OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": get_system_prompt(detected_language)},
+                    {"role": "user", "content": prompt}
+                ],
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    record_llm_usage(chunk, Config.OPENAI_MODEL, 'explain')
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            UPSTREAM_RESPONSES.inc(upstream='llm', status=getattr(e, 'status_code', None) or 'error')
+            raise
+    UPSTREAM_RESPONSES.inc(upstream='llm', status=200)
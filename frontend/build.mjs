@@ -0,0 +1,93 @@
+// Builds the production bundle of the web UI into static/dist/.
+//
+// templates/index.html stays the single source of the UI: its <style> and
+// <script type="text/babel"> blocks are extracted, the JSX is compiled and
+// minified ahead of time with esbuild against production React builds, and
+// the CSS is concatenated with the Tailwind and Font Awesome stylesheets.
+// Every output file name carries a content hash so it can be cached forever;
+// static/dist/manifest.json maps logical names to the hashed files and is
+// read by the Flask app to render templates/index_bundle.html.
+//
+// Usage: npm install && npm run build
+
+import { createHash } from 'node:crypto';
+import { mkdirSync, readFileSync, readdirSync, rmSync, writeFileSync } from 'node:fs';
+import { dirname, join, resolve } from 'node:path';
+import { fileURLToPath } from 'node:url';
+import { brotliCompressSync, constants as zlibConstants, gzipSync } from 'node:zlib';
+import * as esbuild from 'esbuild';
+
+const here = dirname(fileURLToPath(import.meta.url));
+const root = resolve(here, '..');
+const template = join(root, 'templates', 'index.html');
+const outDir = join(root, 'static', 'dist');
+const modules = join(here, 'node_modules');
+
+// The page uses React, ReactDOM and axios as globals loaded from the CDN
+const PRELUDE = `import React from 'react';
+import ReactDOM from 'react-dom';
+import axios from 'axios';
+`;
+
+function extract(html, pattern, what) {
+    const match = html.match(pattern);
+    if (!match) {
+        throw new Error(`No ${what} block found in ${template}`);
+    }
+    return match[1];
+}
+
+function contentHash(data) {
+    return createHash('sha256').update(data).digest('hex').slice(0, 12);
+}
+
+// Write a content-hashed file plus .gz and .br siblings; returns its path relative to outDir
+function emit(subdir, name, ext, data, compress = true) {
+    const file = `${subdir}/${name}.${contentHash(data)}.${ext}`;
+    writeFileSync(join(outDir, file), data);
+    if (compress) {
+        writeFileSync(join(outDir, `${file}.gz`), gzipSync(data, { level: 9 }));
+        writeFileSync(join(outDir, `${file}.br`), brotliCompressSync(data, {
+            params: { [zlibConstants.BROTLI_PARAM_QUALITY]: zlibConstants.BROTLI_MAX_QUALITY },
+        }));
+    }
+    return file;
+}
+
+const html = readFileSync(template, 'utf8');
+const jsx = extract(html, /<script type="text\/babel">([\s\S]*?)<\/script>/, 'text/babel script');
+const style = extract(html, /<style>([\s\S]*?)<\/style>/, 'style');
+
+rmSync(outDir, { recursive: true, force: true });
+for (const subdir of ['js', 'css', 'webfonts']) {
+    mkdirSync(join(outDir, subdir), { recursive: true });
+}
+
+const result = await esbuild.build({
+    stdin: { contents: PRELUDE + jsx, loader: 'jsx', resolveDir: here, sourcefile: 'index.jsx' },
+    bundle: true,
+    minify: true,
+    format: 'iife',
+    target: ['es2018'],
+    define: { 'process.env.NODE_ENV': '"production"' },
+    legalComments: 'none',
+    write: false,
+});
+const appJs = emit('js', 'app', 'js', result.outputFiles[0].contents);
+
+// Font files are fingerprinted too, and the stylesheet is rewritten to point at them
+const fontAwesome = join(modules, '@fortawesome', 'fontawesome-free');
+let fontCss = readFileSync(join(fontAwesome, 'css', 'all.min.css'), 'utf8');
+for (const font of readdirSync(join(fontAwesome, 'webfonts'))) {
+    const data = readFileSync(join(fontAwesome, 'webfonts', font));
+    const [name, ext] = [font.slice(0, font.lastIndexOf('.')), font.slice(font.lastIndexOf('.') + 1)];
+    const hashed = emit('webfonts', name, ext, data, ext === 'ttf');
+    fontCss = fontCss.replaceAll(`../webfonts/${font}`, `../${hashed}`);
+}
+
+const tailwind = readFileSync(join(modules, 'tailwindcss', 'dist', 'tailwind.min.css'), 'utf8');
+const appCss = emit('css', 'app', 'css', [tailwind, fontCss, style].join('\n'));
+
+const manifest = { 'app.js': appJs, 'app.css': appCss };
+writeFileSync(join(outDir, 'manifest.json'), JSON.stringify(manifest, null, 2) + '\n');
+console.log(`Wrote ${outDir}:`, manifest);
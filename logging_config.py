@@ -0,0 +1,186 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from config import Config
+
+# Attributes present on every LogRecord; anything else was passed via `extra=` and is a structured field
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class Truncated:
+    """Lazily truncated log argument.
+
+    Wrapping a payload in Truncated defers both its str() conversion and the
+    truncation until a handler actually formats the record, so disabled or
+    sampled-out log calls cost nothing beyond the object allocation.
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit: Optional[int] = None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = str(self.value)
+        limit = self.limit if self.limit is not None else Config.LOG_MAX_PAYLOAD_CHARS
+        if Config.LOG_DEBUG or limit <= 0 or len(text) <= limit:
+            return text
+        return f"{text[:limit]}...[truncated {len(text) - limit} chars]"
+
+    __repr__ = __str__
+
+
+def truncate(value, limit: Optional[int] = None) -> Truncated:
+    """Wrap a potentially large log argument so it is size-capped when formatted"""
+    return Truncated(value, limit)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects including any `extra=` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class RouteSamplingFilter(logging.Filter):
+    """Samples INFO and lower records per Flask route.
+
+    The keep/drop decision is made once per request so that a sampled request
+    keeps all of its log lines. WARNING and above are never dropped, and
+    records emitted outside a request context always pass.
+    """
+
+    def __init__(self, default_rate: float, route_rates: Dict[str, float]):
+        super().__init__()
+        self.default_rate = default_rate
+        self.route_rates = route_rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        try:
+            from flask import g, has_request_context, request
+        except ImportError:
+            return True
+        if not has_request_context():
+            return True
+        sampled = g.get('_log_sampled')
+        if sampled is None:
+            route = request.url_rule.rule if request.url_rule else request.path
+            rate = self.route_rates.get(route, self.default_rate)
+            sampled = rate >= 1.0 or random.random() < rate
+            g._log_sampled = sampled
+        return sampled
+
+
+def _snapshot(value):
+    """Shallow copy of a mutable container argument, so later changes by the caller do not reach the log"""
+    if isinstance(value, Truncated):
+        return Truncated(_snapshot(value.value), value.limit)
+    if isinstance(value, (dict, list, set)):
+        return value.copy()
+    return value
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves the formatting of large payloads to the listener thread.
+
+    The stock QueueHandler merges args into the message in the calling thread.
+    Here a record without `Truncated` args is merged the same way (it is
+    cheap), while a record with them is enqueued with its args snapshotted:
+    containers are shallow-copied so the caller may keep mutating them, and
+    the str() conversion and truncation of the payloads happen in the
+    listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if not args:
+            return record
+        values = args.values() if isinstance(args, dict) else args
+        if not any(isinstance(value, Truncated) for value in values):
+            record.msg = record.getMessage()
+            record.args = None
+        elif isinstance(args, dict):
+            record.args = {key: _snapshot(value) for key, value in args.items()}
+        else:
+            record.args = tuple(_snapshot(value) for value in args)
+        return record
+
+
+def parse_route_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "route=rate,route=rate" into a dict, ignoring malformed entries"""
+    rates = {}
+    for item in (spec or '').split(','):
+        route, sep, rate = item.strip().rpartition('=')
+        if not sep or not route:
+            continue
+        try:
+            rates[route] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def setup_logging():
+    """Configure root logging with a non-blocking queue handler.
+
+    Log calls only enqueue the record; a background QueueListener thread does
+    the formatting and stream I/O. In debug mode (TDR_LOG_DEBUG) everything is
+    logged at DEBUG level, unsampled and untruncated.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = logging.DEBUG if Config.LOG_DEBUG else getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO)
+
+    stream_handler = logging.StreamHandler()
+    if Config.LOG_FORMAT == 'json':
+        stream_handler.setFormatter(StructuredFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    if not Config.LOG_DEBUG:
+        queue_handler.addFilter(RouteSamplingFilter(Config.LOG_SAMPLE_RATE,
+                                                    parse_route_sample_rates(Config.LOG_ROUTE_SAMPLE_RATES)))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the background listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
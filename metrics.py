@@ -0,0 +1,240 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from profiling import record_span
+
+# Default latency buckets (seconds), tuned for sub-millisecond parsing stages up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape_label_value(value: str) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    """Render a label set as {a="x",b="y"}"""
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape_label_value(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value, keeping integers free of a trailing .0"""
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for labeled metrics"""
+
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _label_key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        """Turn keyword labels into an ordered tuple key"""
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        """Render this metric in the Prometheus text exposition format"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter with optional labels"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        """Increment the counter for the given label set"""
+        key = self._label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Get the current value for the given label set"""
+        with self._lock:
+            return self._values.get(self._label_key(labels), 0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets and optional labels"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        """Record a single observation"""
+        key = self._label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager that observes the wall-clock duration of its body.
+
+        The duration is also recorded as a span of a request profile running on this thread.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(duration, **labels)
+            record_span(self.name, labels, start, duration)
+
+    def count(self, **labels) -> int:
+        """Get the number of observations for the given label set"""
+        with self._lock:
+            state = self._values.get(self._label_key(labels))
+            return sum(state[0]) if state else 0
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1])) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Add a metric to the registry and return it"""
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all registered metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Global registry and the metrics recorded by the application
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_LATENCY = REGISTRY.histogram(
+    'tdr_http_request_duration_seconds',
+    'Latency of requests handled by the Flask app',
+    ['route', 'method', 'status']
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    'tdr_pipeline_stage_duration_seconds',
+    'Latency of individual query pipeline stages',
+    ['stage']
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'tdr_upstream_request_duration_seconds',
+    'Latency of calls to upstream services (TDR API and LLM provider)',
+    ['upstream', 'operation']
+)
+UPSTREAM_RESPONSES = REGISTRY.counter(
+    'tdr_upstream_responses_total',
+    'Upstream responses by status code (status="error" for transport failures)',
+    ['upstream', 'status']
+)
+QUERIES_PROCESSED = REGISTRY.counter(
+    'tdr_queries_processed_total',
+    'Natural language queries by processing method',
+    ['processing_method']
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'tdr_cache_requests_total',
+    'Cache lookups by cache name and result (hit/miss)',
+    ['cache', 'result']
+)
+LLM_TOKENS = REGISTRY.counter(
+    'tdr_llm_tokens_total',
+    'LLM token usage reported by the provider',
+    ['model', 'operation', 'kind']
+)
+SPECULATIVE_PREFETCHES = REGISTRY.counter(
+    'tdr_speculative_prefetch_total',
+    'Speculative upstream prefetches by outcome (started/used/wasted/failed)',
+    ['result']
+)
+SUBSCRIPTION_EVENTS = REGISTRY.counter(
+    'tdr_subscription_events_total',
+    'Events pushed to subscribers of /api/subscribe streams, by event (snapshot/diff/error)',
+    ['event']
+)
+AUDIT_LOG_RECORDS = REGISTRY.counter(
+    'tdr_audit_log_records_total',
+    'Request audit log entries by result (written/dropped/failed)',
+    ['result']
+)
+
+
+def record_llm_usage(response, model: str, operation: str):
+    """Record token usage from an OpenAI-compatible chat completion response"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        value = getattr(usage, kind, None)
+        if value:
+            LLM_TOKENS.inc(value, model=model, operation=operation, kind=kind.replace('_tokens', ''))
@@ -0,0 +1,132 @@
+import cProfile
+import logging
+import marshal
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SORT_KEYS = {'cumulative': 3, 'tottime': 2, 'calls': 1}
+
+_current = threading.local()
+# Set while a profile is being recorded, so span recording is a single check while profiling is idle
+_active = False
+# Held by the profile being recorded: there is only one profiler per process on Python 3.12+
+_active_lock = threading.Lock()
+
+
+class RequestProfile:
+    """Function-level CPU profile and wall-clock spans of one request.
+
+    Spans are recorded by metrics.Histogram.time for the thread handling
+    the request, so every timed parsing stage, LLM call and upstream call of
+    the request is included; work handed to a thread pool shows up as the
+    time spent waiting for it. Only one profile is recorded at a time. Up to
+    Python 3.11 the CPU profile covers the request thread only; from 3.12
+    cProfile also records other threads running at the same time.
+    """
+
+    def __init__(self, endpoint: str, method: str, path: str, trigger: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.ts = datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+        self.status: Optional[int] = None
+        self.duration = 0.0
+        self.spans: List[Dict] = []
+        self.stats: Dict = {}
+        self._profiler = cProfile.Profile()
+        self._start = 0.0
+
+    def start(self) -> bool:
+        """Start recording; False if another profile is being recorded or the profiler cannot be enabled"""
+        global _active
+        if not _active_lock.acquire(blocking=False):
+            return False
+        try:
+            self._profiler.enable()
+        except (ValueError, RuntimeError) as e:
+            # Another tool (a debugger or an outer profiler) holds the profiling hook
+            logger.warning("Could not start request profile: %s", e)
+            _active_lock.release()
+            return False
+        self._start = time.perf_counter()
+        _current.profile = self
+        _active = True
+        return True
+
+    def stop(self, status: Optional[int]):
+        global _active
+        self._profiler.disable()
+        self.duration = time.perf_counter() - self._start
+        self.status = status
+        _active = False
+        _current.profile = None
+        _active_lock.release()
+        self._profiler.create_stats()
+        self.stats = self._profiler.stats
+        self._profiler = None
+
+    def add_span(self, metric: str, labels: Dict, start: float, duration: float):
+        self.spans.append({'metric': metric, 'labels': labels, 'start_ms': round((start - self._start) * 1000, 3),
+                           'duration_ms': round(duration * 1000, 3)})
+
+    def summary(self) -> Dict:
+        return {'id': self.id, 'ts': self.ts, 'endpoint': self.endpoint, 'method': self.method, 'path': self.path,
+                'trigger': self.trigger, 'status': self.status, 'duration_ms': round(self.duration * 1000, 3)}
+
+    def functions(self, sort: str = 'cumulative', limit: int = 30) -> List[Dict]:
+        """The top functions of the CPU profile"""
+        column = SORT_KEYS.get(sort, SORT_KEYS['cumulative'])
+        rows = sorted(self.stats.items(), key=lambda item: item[1][column], reverse=True)[:limit]
+        return [{'function': pstats.func_std_string(func).replace(os.getcwd() + os.sep, ''),
+                 'calls': nc, 'primitive_calls': cc, 'own_ms': round(tt * 1000, 3), 'cumulative_ms': round(ct * 1000, 3)}
+                for func, (cc, nc, tt, ct, _callers) in rows]
+
+    def to_dict(self, sort: str = 'cumulative', limit: int = 30) -> Dict:
+        return {**self.summary(), 'spans': self.spans, 'functions': self.functions(sort, limit)}
+
+    def dump_stats(self) -> bytes:
+        """The CPU profile in the pstats file format (readable by `python -m pstats` and snakeviz)"""
+        return marshal.dumps(self.stats)
+
+
+def record_span(metric: str, labels: Dict, start: float, duration: float):
+    """Add a timed span to the profile being recorded on this thread, if any"""
+    if _active:
+        profile = getattr(_current, 'profile', None)
+        if profile is not None:
+            profile.add_span(metric, labels, start, duration)
+
+
+class ProfileBuffer:
+    """Thread-safe ring buffer of the most recent request profiles"""
+
+    def __init__(self, size: int = 50):
+        self._profiles: "deque[RequestProfile]" = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((p for p in self._profiles if p.id == profile_id), None)
+
+    def list(self) -> List[Dict]:
+        """Summaries of the stored profiles, newest first"""
+        with self._lock:
+            return [p.summary() for p in reversed(self._profiles)]
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
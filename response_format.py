@@ -0,0 +1,91 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard library parser
+    orjson = None
+
+# Output formats for /api/proxy?format=
+FORMATS = ('compact', 'ndjson', 'columnar')
+
+_MIMETYPES = {
+    'compact': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/json',
+}
+
+
+def loads(content: bytes) -> Any:
+    """Parse JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize JSON without insignificant whitespace, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def parse_fields(spec: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated fields= value; None means no projection"""
+    fields = [field.strip() for field in (spec or '').split(',') if field.strip()]
+    return fields or None
+
+
+def _records(data: Any) -> Tuple[Optional[list], Dict]:
+    """Split a TDR response into its record list (the `data` list, if any) and other top-level fields"""
+    if isinstance(data, dict) and isinstance(data.get('data'), list):
+        return data['data'], {k: v for k, v in data.items() if k != 'data'}
+    if isinstance(data, list):
+        return data, {}
+    return None, data if isinstance(data, dict) else {}
+
+
+def project(data: Any, fields: Optional[List[str]]) -> Any:
+    """Keep only the given fields of each record of a list response, or of a single object.
+
+    Top-level fields next to a `data` list (such as `summary`) are kept.
+    """
+    if not fields:
+        return data
+    records, rest = _records(data)
+    if records is None:
+        return {k: v for k, v in data.items() if k in fields} if isinstance(data, dict) else data
+    projected = [{k: record[k] for k in fields if k in record} if isinstance(record, dict) else record
+                 for record in records]
+    return {**rest, 'data': projected} if isinstance(data, dict) else projected
+
+
+def to_columnar(data: Any) -> Any:
+    """Turn the records of a list response into one array per field.
+
+    `{"data": [{"user": "a", "risk": 5}, ...], "summary": "..."}` becomes
+    `{"columns": {"user": ["a", ...], "risk": [5, ...]}, "rows": n, "summary": "..."}`.
+    Fields missing from a record are null. Non-list responses are returned unchanged.
+    """
+    records, rest = _records(data)
+    if records is None:
+        return data
+    names: Dict[str, None] = {}
+    for record in records:
+        if isinstance(record, dict):
+            names.update(dict.fromkeys(record))
+    columns = {name: [record.get(name) if isinstance(record, dict) else None for record in records] for name in names}
+    return {**rest, 'columns': columns, 'rows': len(records)}
+
+
+def encode(data: Any, fmt: str) -> Tuple[bytes, str]:
+    """Encode a (projected) response in one of FORMATS; returns (body, mimetype)"""
+    if fmt == 'ndjson':
+        records, _ = _records(data)
+        lines = records if records is not None else [data]
+        body = b''.join(dumps(line) + b'\n' for line in lines)
+    elif fmt == 'columnar':
+        body = dumps(to_columnar(data))
+    else:
+        body = dumps(data)
+    return body, _MIMETYPES[fmt]
@@ -0,0 +1,93 @@
+import logging
+import threading
+from datetime import datetime, time as dt_time, timedelta
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def parse_times(spec: str) -> List[dt_time]:
+    """Parse "HH:MM,HH:MM" into a sorted list of times, ignoring malformed entries"""
+    times = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            times.append(datetime.strptime(item, '%H:%M').time())
+        except ValueError:
+            logger.warning("Ignoring invalid schedule time: %s", item)
+    return sorted(set(times))
+
+
+class DailyScheduler:
+    """Runs a job in a background thread at fixed local times every day.
+
+    A run that is still in progress when the next time comes round is not
+    overlapped; the missed slot is simply skipped.
+    """
+
+    def __init__(self, name: str, times: List[dt_time], job: Callable[[], None]):
+        self.name = name
+        self.times = times
+        self.job = job
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.last_run: Optional[datetime] = None
+
+    def next_run(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Next scheduled run strictly after now"""
+        if not self.times:
+            return None
+        now = now or datetime.now()
+        for day_offset in (0, 1):
+            day = now.date() + timedelta(days=day_offset)
+            for run_time in self.times:
+                candidate = datetime.combine(day, run_time)
+                if candidate > now:
+                    return candidate
+        return None
+
+    def start(self):
+        """Start the scheduler thread"""
+        if self._thread is not None or not self.times:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=f"{self.name}-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("%s scheduler started, next run at %s", self.name, self.next_run())
+
+    def stop(self):
+        """Stop the scheduler thread"""
+        self._stop.set()
+        self._thread = None
+
+    def is_running(self) -> bool:
+        """Whether a run is currently in progress"""
+        return self._run_lock.locked()
+
+    def run_now(self) -> bool:
+        """Run the job immediately in the calling thread; returns False if a run is already in progress"""
+        if not self._run_lock.acquire(blocking=False):
+            return False
+        try:
+            started = datetime.now()
+            logger.info("%s run started", self.name)
+            self.job()
+            self.last_run = started
+            logger.info("%s run finished in %.1fs", self.name, (datetime.now() - started).total_seconds())
+        except Exception as e:
+            logger.error("%s run failed: %s", self.name, e)
+        finally:
+            self._run_lock.release()
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            next_run = self.next_run()
+            if next_run is None:
+                return
+            if self._stop.wait(max(0.0, (next_run - datetime.now()).total_seconds())):
+                return
+            self.run_now()
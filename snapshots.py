@@ -0,0 +1,114 @@
+import json
+import threading
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+from cache import TTLCache
+
+# Fields identifying an entity in the `data` list of a TDR list response, in order of preference
+ENTITY_KEY_FIELDS = ('id', 'user', 'device')
+
+
+def entity_key(item: Any) -> str:
+    """Stable identity of one entry of a `data` list"""
+    if isinstance(item, dict):
+        for field in ENTITY_KEY_FIELDS:
+            if item.get(field) is not None:
+                return str(item[field])
+    return json.dumps(item, sort_keys=True, default=str)
+
+
+def _without(item: Any, ignore_fields: Iterable[str]) -> Any:
+    if isinstance(item, dict) and ignore_fields:
+        return {k: v for k, v in item.items() if k not in ignore_fields}
+    return item
+
+
+def _risk_delta(before: Any, after: Any) -> Optional[float]:
+    if isinstance(before, dict) and isinstance(after, dict):
+        old, new = before.get('risk'), after.get('risk')
+        if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+            return new - old
+    return None
+
+
+def diff_snapshots(previous: Any, current: Any, ignore_fields: Iterable[str] = ()) -> Optional[Dict]:
+    """Structured diff between two TDR API responses, or None if nothing changed.
+
+    Entries of a top-level `data` list are matched by `entity_key` and reported
+    as `added` (entries), `removed` (keys) and `changed` (key, before, after and
+    `risk_delta` when both sides carry a numeric risk). Other top-level fields
+    that changed are reported under `fields` with their new values, and dropped
+    ones under `removed_fields`. Fields in `ignore_fields` are not compared.
+    Anything that is not a JSON object is reported as `{"replaced": current}`.
+    """
+    ignore_fields = tuple(ignore_fields)
+    if not isinstance(previous, dict) or not isinstance(current, dict):
+        return None if previous == current else {'replaced': current}
+
+    diff: Dict[str, Any] = {}
+    old_data, new_data = previous.get('data'), current.get('data')
+    if isinstance(old_data, list) and isinstance(new_data, list):
+        old_items = {entity_key(item): item for item in old_data}
+        new_items = {entity_key(item): item for item in new_data}
+        added = [item for key, item in new_items.items() if key not in old_items]
+        removed = [key for key in old_items if key not in new_items]
+        changed = []
+        for key, item in new_items.items():
+            before = old_items.get(key)
+            if before is not None and _without(before, ignore_fields) != _without(item, ignore_fields):
+                change = {'key': key, 'before': before, 'after': item}
+                delta = _risk_delta(before, item)
+                if delta is not None:
+                    change['risk_delta'] = delta
+                changed.append(change)
+        if added:
+            diff['added'] = added
+        if removed:
+            diff['removed'] = removed
+        if changed:
+            diff['changed'] = changed
+    elif old_data != new_data and 'data' not in ignore_fields:
+        diff.setdefault('fields', {})['data'] = new_data
+
+    for field, value in current.items():
+        if field == 'data' or field in ignore_fields:
+            continue
+        if field not in previous or previous[field] != value:
+            diff.setdefault('fields', {})[field] = value
+    removed_fields = [field for field in previous
+                      if field not in current and field != 'data' and field not in ignore_fields]
+    if removed_fields:
+        diff['removed_fields'] = removed_fields
+    return diff or None
+
+
+class SnapshotStore:
+    """Keeps the latest explained snapshot of each view for the two most recent days.
+
+    A view is an endpoint with its parameters minus the date, so the same list
+    viewed on consecutive days maps to one entry. Each snapshot is stored with
+    the day it describes (`as_of`) and a short summary of its explanation,
+    which serve as the baseline for a "what changed" explanation on a later day.
+    """
+
+    def __init__(self, max_views: int = 256, ttl: float = 8 * 86400):
+        self._views = TTLCache('snapshot', max_entries=max_views, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def baseline(self, key: Hashable, as_of: str) -> Optional[Dict]:
+        """The most recent snapshot of the view from a day before as_of"""
+        for entry in self._views.get(key) or ():
+            if entry['as_of'] < as_of:
+                return entry
+        return None
+
+    def record(self, key: Hashable, as_of: str, data: Any, summary: str):
+        """Store the snapshot of a view for a day, replacing an earlier one for the same day"""
+        entry = {'as_of': as_of, 'data': data, 'summary': summary}
+        with self._lock:
+            entries = [e for e in (self._views.get(key) or ()) if e['as_of'] != as_of] + [entry]
+            entries.sort(key=lambda e: e['as_of'], reverse=True)
+            self._views.set(key, tuple(entries[:2]))
+
+    def clear(self):
+        self._views.clear()
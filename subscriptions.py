@@ -0,0 +1,170 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from metrics import SUBSCRIPTION_EVENTS
+from snapshots import diff_snapshots
+
+logger = logging.getLogger(__name__)
+
+# Queued to a subscriber when its poller shuts down, ending the stream
+CLOSED = ('closed', None)
+
+
+class PollerLimitReached(Exception):
+    """Raised when a subscription would need a new poller beyond the configured maximum"""
+
+
+class SnapshotPoller:
+    """Polls one upstream view on an interval and broadcasts changes to its subscribers.
+
+    New subscribers first receive the latest full snapshot, then one `diff`
+    event per poll that changed something (see snapshots.diff_snapshots).
+    A failing poll is broadcast once as an `error` event and the previous
+    snapshot is kept, so the next successful poll diffs against it. A
+    subscriber whose queue is full is resynchronized with a fresh snapshot
+    instead of being sent an incomplete sequence of diffs.
+    """
+
+    def __init__(self, key: Hashable, fetch: Callable[[], Any], interval: float, queue_size: int):
+        self.key = key
+        self.fetch = fetch
+        self.interval = interval
+        self.queue_size = queue_size
+        self.snapshot: Any = None
+        self._has_snapshot = False
+        self._last_error: Optional[str] = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='subscription-poller', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling and close every subscriber stream"""
+        self._stop.set()
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, set()
+        for subscriber in subscribers:
+            self._put(subscriber, CLOSED)
+
+    def subscribe(self) -> queue.Queue:
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self._has_snapshot:
+                subscriber.put_nowait(('snapshot', self.snapshot))
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> int:
+        """Remove a subscriber; returns the number left"""
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            return len(self._subscribers)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.interval)
+
+    def poll(self):
+        """Fetch the view once and broadcast what changed"""
+        try:
+            current = self.fetch()
+        except Exception as e:
+            error = str(e)
+            if error != self._last_error:
+                logger.warning("Subscription poll failed for %s: %s", self.key, e)
+                self._last_error = error
+                with self._lock:
+                    self._broadcast('error', {'error': error})
+            return
+        self._last_error = None
+        # Diff and broadcast under the lock, so a concurrent subscriber gets either the old
+        # snapshot followed by this diff or the new snapshot, never both
+        with self._lock:
+            if not self._has_snapshot:
+                event = ('snapshot', current)
+            else:
+                diff = diff_snapshots(self.snapshot, current)
+                event = ('diff', diff) if diff else None
+            self.snapshot, self._has_snapshot = current, True
+            if event:
+                self._broadcast(*event)
+
+    def _broadcast(self, event: str, payload: Any):
+        """Queue an event to every subscriber; must be called with the lock held"""
+        for subscriber in self._subscribers:
+            if not self._put(subscriber, (event, payload)):
+                # Drop what the slow client has not read yet and resend the full state
+                self._drain(subscriber)
+                self._put(subscriber, ('snapshot', self.snapshot))
+        SUBSCRIPTION_EVENTS.inc(len(self._subscribers), event=event)
+
+    @staticmethod
+    def _put(subscriber: queue.Queue, item: Tuple[str, Any]) -> bool:
+        try:
+            subscriber.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    @staticmethod
+    def _drain(subscriber: queue.Queue):
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class SubscriptionHub:
+    """One SnapshotPoller per subscription key, shared by all of its subscribers.
+
+    Upstream load therefore depends on the number of distinct views being
+    watched, not on the number of viewers. A poller is started by its first
+    subscriber and stopped when its last subscriber leaves.
+    """
+
+    def __init__(self, interval: float, max_pollers: int = 64, queue_size: int = 100):
+        self.interval = interval
+        self.max_pollers = max_pollers
+        self.queue_size = queue_size
+        self._pollers: Dict[Hashable, SnapshotPoller] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key: Hashable, fetch: Callable[[], Any]) -> Tuple[SnapshotPoller, queue.Queue]:
+        """Subscribe to the view identified by key; fetch is used if a new poller has to be started"""
+        with self._lock:
+            poller = self._pollers.get(key)
+            if poller is None:
+                if len(self._pollers) >= self.max_pollers:
+                    raise PollerLimitReached(f'At most {self.max_pollers} views can be watched at once')
+                poller = self._pollers[key] = SnapshotPoller(key, fetch, self.interval, self.queue_size)
+                poller.start()
+            return poller, poller.subscribe()
+
+    def unsubscribe(self, poller: SnapshotPoller, subscriber: queue.Queue):
+        with self._lock:
+            if poller.unsubscribe(subscriber) == 0 and self._pollers.get(poller.key) is poller:
+                del self._pollers[poller.key]
+                poller.stop()
+
+    def close_all(self):
+        """Stop every poller and end all subscriber streams (clients reconnect and resubscribe)"""
+        with self._lock:
+            pollers, self._pollers = list(self._pollers.values()), {}
+        for poller in pollers:
+            poller.stop()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pollers = list(self._pollers.values())
+        return {'pollers': len(pollers), 'subscribers': sum(p.subscriber_count() for p in pollers)}
@@ -0,0 +1,284 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('user', 'device', 'rare_process', 'org')
+OPERATIONS = ('count', 'top', 'trend')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entity_risk (
+    kind TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    date TEXT NOT NULL,
+    risk INTEGER,
+    PRIMARY KEY (kind, entity, date)
+);
+CREATE INDEX IF NOT EXISTS entity_risk_kind_date ON entity_risk (kind, date);
+CREATE TABLE IF NOT EXISTS rare_processes (
+    id INTEGER PRIMARY KEY,
+    entity TEXT,
+    executable TEXT,
+    date TEXT,
+    started_at TEXT,
+    ended_at TEXT,
+    risk INTEGER,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS rare_processes_date ON rare_processes (date);
+CREATE INDEX IF NOT EXISTS rare_processes_entity ON rare_processes (entity, date);
+CREATE TABLE IF NOT EXISTS summaries (
+    kind TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    date TEXT NOT NULL,
+    summary TEXT,
+    PRIMARY KEY (kind, entity, date)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    kind TEXT NOT NULL,
+    date TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    PRIMARY KEY (kind, date)
+);
+"""
+
+# Kinds whose list coverage an aggregate depends on (the org trend is computed from users and devices)
+_COVERAGE_KINDS = {'user': ('user',), 'device': ('device',), 'rare_process': ('rare_process',), 'org': ('user', 'device')}
+
+# Tables pruned by retention, all keyed by a date column
+_DATED_TABLES = ('entity_risk', 'rare_processes', 'summaries', 'coverage')
+
+# How often ingest prunes rows older than the retention period
+_PRUNE_INTERVAL = 3600
+
+_LIST_KINDS = {'threats/users': ('user', 'user'), 'threats/devices': ('device', 'device')}
+_ENTITY_SUMMARY = re.compile(r'^threats/(users|devices)/([^/]+)/summary$')
+_RARE_PROCESS_SUMMARY = re.compile(r'^threats/rare-processes/(\d+)/summary$')
+
+
+class ThreatStore:
+    """Embedded SQLite store of the threat data that passes through the agent.
+
+    Every `/threats/*` response is upserted into tables indexed by date and
+    entity: per-day user and device risk, rare process executions, and the
+    entity/org summary texts. Aggregate questions (distinct counts, top-k by
+    occurrences and daily trends) are then answered locally with indexed
+    GROUP BY queries instead of many upstream calls. A single connection is
+    shared behind a lock; writes are small and infrequent.
+
+    List responses are cut off at their request's limit, so the store also
+    records per kind and day whether it has seen a complete list (fewer rows
+    than the limit). Aggregates report that coverage, and callers should only
+    trust a result whose period is completely covered. Rows older than
+    `retention_days` are pruned.
+    """
+
+    def __init__(self, path: str, retention_days: int = 90):
+        self.path = path
+        self.retention_days = retention_days
+        self._last_prune = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(_SCHEMA)
+        self.prune()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def ingest(self, api_path: str, data: Any, params: Optional[Dict] = None) -> int:
+        """Store one TDR API response to a request with the given query parameters; returns the number of rows written"""
+        if not isinstance(data, dict):
+            return 0
+        if time.monotonic() - self._last_prune > _PRUNE_INTERVAL:
+            self.prune()
+        path = api_path.strip('/')
+        params = params or {}
+        try:
+            if path in _LIST_KINDS:
+                kind, field = _LIST_KINDS[path]
+                items = data.get('data') or []
+                rows = [(kind, str(item[field]), item['date'], item.get('risk'))
+                        for item in items if item.get(field) and item.get('date')]
+                self._record_coverage(kind, params, items, {row[2] for row in rows})
+                return self._write('INSERT OR REPLACE INTO entity_risk VALUES (?, ?, ?, ?)', rows)
+            if path == 'threats/rare-processes':
+                items = data.get('data') or []
+                rows = [self._rare_process_row(item['id'], item) for item in items if item.get('id')]
+                self._record_coverage('rare_process', params, items, {row[3] for row in rows if row[3]})
+                # Upsert so a summary stored for the alert is kept
+                return self._write('INSERT INTO rare_processes (id, entity, executable, date, started_at, ended_at, risk) '
+                                   'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET entity = excluded.entity, '
+                                   'executable = excluded.executable, date = excluded.date, started_at = excluded.started_at, '
+                                   'ended_at = excluded.ended_at, risk = excluded.risk', rows)
+            match = _RARE_PROCESS_SUMMARY.match(path)
+            if match:
+                row = self._rare_process_row(int(match.group(1)), data) + (data.get('summary'),)
+                return self._write('INSERT OR REPLACE INTO rare_processes VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [row])
+            match = _ENTITY_SUMMARY.match(path)
+            if match:
+                kind = match.group(1)[:-1]
+                entity = str(data.get(kind) or match.group(2))
+                return self._write('INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)',
+                                   [(kind, entity, data.get('date'), data.get('summary'))] if data.get('date') else [])
+            if path == 'threats/org/summary' and data.get('date'):
+                return self._write('INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)',
+                                   [('org', '', data['date'], data.get('summary'))])
+        except (KeyError, TypeError, AttributeError, sqlite3.Error) as e:
+            logger.warning("Threat store ingest failed for /%s: %s", path, e)
+        return 0
+
+    def _record_coverage(self, kind: str, params: Dict, items: list, dates: set):
+        """Mark the days a list response covers, completely if it returned fewer rows than its limit"""
+        try:
+            complete = params.get('limit') is not None and len(items) < int(params['limit'])
+        except (TypeError, ValueError):
+            complete = False
+        if params.get('date[eq]'):
+            dates = {str(params['date[eq]'])}
+        # Once a day has been seen complete it stays complete
+        self._write('INSERT INTO coverage VALUES (?, ?, ?) ON CONFLICT (kind, date) '
+                    'DO UPDATE SET complete = MAX(complete, excluded.complete)',
+                    [(kind, day, int(complete)) for day in dates])
+
+    def prune(self) -> int:
+        """Delete rows older than the retention period; returns the number of rows deleted"""
+        self._last_prune = time.monotonic()
+        if not self.retention_days or self.retention_days <= 0:
+            return 0
+        cutoff = (date.today() - timedelta(days=self.retention_days)).isoformat()
+        deleted = 0
+        with self._lock:
+            with self._conn:
+                for table in _DATED_TABLES:
+                    deleted += self._conn.execute(f"DELETE FROM {table} WHERE date < ?", (cutoff,)).rowcount
+        if deleted:
+            logger.info("Threat store pruned %d rows older than %s", deleted, cutoff)
+        return deleted
+
+    def coverage(self, kind: str, since: Optional[str] = None, until: Optional[str] = None) -> Dict:
+        """Days of the range the store has complete lists for, and days asked for.
+
+        An open range asks for every day the store has seen data for.
+        """
+        kinds = _COVERAGE_KINDS[kind]
+        condition, params = self._range(since, until)
+        placeholders = ','.join('?' * len(kinds))
+        covered = self._query(f"SELECT COUNT(*) AS days FROM (SELECT date FROM coverage WHERE kind IN ({placeholders}) "
+                              f"AND complete = 1 AND {condition} GROUP BY date HAVING COUNT(DISTINCT kind) = ?)",
+                              kinds + params + (len(kinds),))[0]['days']
+        if since and until:
+            requested = (date.fromisoformat(until) - date.fromisoformat(since)).days + 1
+        else:
+            requested = self._query(f"SELECT COUNT(DISTINCT date) AS days FROM coverage WHERE kind IN ({placeholders}) "
+                                    f"AND {condition}", kinds + params)[0]['days']
+        return {'days_requested': requested, 'days_covered': covered,
+                'complete': requested > 0 and covered >= requested}
+
+    @staticmethod
+    def _rare_process_row(alert_id: int, item: dict) -> tuple:
+        started_at = item.get('started_at') or ''
+        return (alert_id, item.get('entity'), item.get('executable'), started_at[:10] or None, started_at or None,
+                item.get('ended_at'), item.get('risk'))
+
+    def _write(self, sql: str, rows: List[tuple]) -> int:
+        if not rows:
+            return 0
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(sql, rows)
+        return len(rows)
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    @staticmethod
+    def _range(since: Optional[str], until: Optional[str]) -> tuple:
+        """SQL condition and parameters for an inclusive date range"""
+        return "date BETWEEN ? AND ?", (since or '0000-00-00', until or '9999-99-99')
+
+    def aggregate(self, operation: str, kind: str, since: Optional[str] = None, until: Optional[str] = None,
+                  limit: int = 10, field: str = 'entity') -> Dict:
+        """Answer a count, top or trend question for a kind of threat data over a date range"""
+        if operation not in OPERATIONS or kind not in KINDS:
+            raise ValueError(f"Unsupported aggregate: {operation} {kind}")
+        if operation == 'count':
+            rows = self.count(kind, since, until)
+        elif operation == 'top':
+            rows = self.top(kind, since, until, limit, field)
+        else:
+            rows = self.trend(kind, since, until)
+        return {'operation': operation, 'kind': kind, 'since': since, 'until': until, 'result': rows,
+                'coverage': self.coverage(kind, since, until)}
+
+    def count(self, kind: str, since: Optional[str] = None, until: Optional[str] = None) -> Dict:
+        """Distinct risky entities (or rare process executions, or org summaries) in the range"""
+        condition, params = self._range(since, until)
+        if kind == 'rare_process':
+            sql = f"SELECT COUNT(*) AS count, COUNT(DISTINCT date) AS days FROM rare_processes WHERE {condition}"
+        elif kind == 'org':
+            sql = f"SELECT COUNT(*) AS count, COUNT(DISTINCT date) AS days FROM summaries WHERE kind = 'org' AND {condition}"
+        else:
+            sql = (f"SELECT COUNT(DISTINCT entity) AS count, COUNT(DISTINCT date) AS days FROM entity_risk "
+                   f"WHERE kind = ? AND {condition}")
+            params = (kind,) + params
+        return self._query(sql, params)[0]
+
+    def top(self, kind: str, since: Optional[str] = None, until: Optional[str] = None, limit: int = 10,
+            field: str = 'entity') -> List[Dict]:
+        """Entities (or executables) that appear most often in the range, then by highest risk"""
+        condition, params = self._range(since, until)
+        if kind == 'rare_process':
+            column = 'executable' if field == 'executable' else 'entity'
+            sql = (f"SELECT {column} AS {column}, COUNT(*) AS occurrences, MAX(risk) AS max_risk, "
+                   f"ROUND(AVG(risk), 1) AS avg_risk FROM rare_processes WHERE {condition} "
+                   f"GROUP BY {column} ORDER BY occurrences DESC, max_risk DESC LIMIT ?")
+        elif kind in ('user', 'device'):
+            sql = (f"SELECT entity AS {kind}, COUNT(*) AS occurrences, MAX(risk) AS max_risk, "
+                   f"ROUND(AVG(risk), 1) AS avg_risk FROM entity_risk WHERE kind = ? AND {condition} "
+                   f"GROUP BY entity ORDER BY occurrences DESC, max_risk DESC LIMIT ?")
+            params = (kind,) + params
+        else:
+            raise ValueError("Top entities are not available for the organization summary")
+        return self._query(sql, params + (limit,))
+
+    def trend(self, kind: str, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict]:
+        """Per-day entity count and average/maximum risk in the range.
+
+        The org summary is free text, so the org trend is computed over the
+        risky users and devices of each day.
+        """
+        condition, params = self._range(since, until)
+        if kind == 'rare_process':
+            sql = (f"SELECT date, COUNT(*) AS count, ROUND(AVG(risk), 1) AS avg_risk, MAX(risk) AS max_risk "
+                   f"FROM rare_processes WHERE {condition} GROUP BY date ORDER BY date")
+        else:
+            kinds = ('user', 'device') if kind == 'org' else (kind,)
+            sql = (f"SELECT date, COUNT(DISTINCT kind || ':' || entity) AS count, ROUND(AVG(risk), 1) AS avg_risk, "
+                   f"MAX(risk) AS max_risk FROM entity_risk WHERE kind IN ({','.join('?' * len(kinds))}) "
+                   f"AND {condition} GROUP BY date ORDER BY date")
+            params = kinds + params
+        return self._query(sql, params)
+
+    def stats(self) -> Dict:
+        """Row counts and covered date range per table"""
+        stats = {}
+        for name, table, where in (('users', 'entity_risk', "kind = 'user'"), ('devices', 'entity_risk', "kind = 'device'"),
+                                   ('rare_processes', 'rare_processes', '1'), ('summaries', 'summaries', '1'),
+                                   ('complete_days', 'coverage', 'complete = 1')):
+            stats[name] = self._query(f"SELECT COUNT(*) AS rows, MIN(date) AS first_date, MAX(date) AS last_date "
+                                      f"FROM {table} WHERE {where}")[0]
+        return stats